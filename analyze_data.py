@@ -0,0 +1,324 @@
+import argparse
+from bisect import bisect_right
+import heapq
+import json
+import sys
+
+from utils.const import SNAPSHOT_DIR
+from utils.snapshots import SnapshotError, iter_snapshot, list_snapshots
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Usage:
+#   python analyze_data.py [top] [xp] [levels] [birthdays]
+#                          [--snapshot FILE] [--guild ID] [-k N] [--per-user] [--json]
+#
+# Offline analytics over a local snapshot (see utils/snapshots.py), the newest one by default:
+#   top        - the K highest-XP members across every guild (--per-user: XP summed per user)
+#   xp         - XP histogram in power-of-two buckets (0, 1, 2-3, 4-7, ...)
+#   levels     - members per level
+#   birthdays  - known birthdays per month
+# With no report named, all of them are computed in a single pass.
+#
+# The snapshot is streamed and aggregated in batches, so memory stays flat (apart from
+# --per-user, which keeps one total per user): top-K uses a bounded heap, the histograms are
+# counters over fixed buckets. NumPy is used for the batch aggregation when it is installed;
+# the pure Python path gives the same results.
+
+REPORTS = ("top", "xp", "levels", "birthdays")
+ANALYZE_BATCH_SIZE = 50_000
+DEFAULT_TOP_K = 10
+MONTHS = (
+    "January",
+    "February",
+    "March",
+    "April",
+    "May",
+    "June",
+    "July",
+    "August",
+    "September",
+    "October",
+    "November",
+    "December",
+)
+
+
+class LevelCurve:
+    """XP needed to leave each level, grown on demand.
+
+    Same curve as utils.leveling.calculate_level_and_thresholds (not imported here: that module
+    pulls in Pillow and discord.py): level 1 ends at 200 XP and every level L after it needs
+    50 * L more.
+    """
+
+    def __init__(self):
+        self.thresholds = [200]  # thresholds[i] = XP at which level i + 1 ends
+
+    def cover(self, xp):
+        while self.thresholds[-1] <= xp:
+            level = len(self.thresholds) + 1
+            self.thresholds.append(self.thresholds[-1] + 50 * level)
+
+    def level(self, xp):
+        self.cover(xp)
+        return bisect_right(self.thresholds, xp) + 1
+
+
+class SnapshotStats:
+    """Aggregates user records batch by batch."""
+
+    def __init__(self, reports, top_k=DEFAULT_TOP_K, per_user=False):
+        self.reports = set(reports)
+        self.top_k = top_k
+        self.per_user = per_user
+        self.users = 0
+        self.top = []  # min-heap of (xp, guild_id, user_id), at most top_k entries
+        self.user_totals = {}  # user_id -> XP across guilds (--per-user only)
+        # Bit length of XP -> count; bucket b holds 2**(b-1) .. 2**b - 1
+        self.xp_buckets = {}
+        self.levels = {}  # level -> count
+        self.months = [0] * 12
+        self.curve = LevelCurve()
+
+    def add_batch(self, guild_ids, user_ids, xps, bdates):
+        self.users += len(xps)
+        if "top" in self.reports:
+            if self.per_user:
+                for user_id, xp in zip(user_ids, xps):
+                    self.user_totals[user_id] = self.user_totals.get(user_id, 0) + xp
+            else:
+                self._add_top(guild_ids, user_ids, xps)
+        if "birthdays" in self.reports:
+            for bdate in bdates:
+                # "dd-mm"; anything else ("Unknown") is skipped
+                if len(bdate) == 5 and bdate[3:].isdigit():
+                    month = int(bdate[3:])
+                    if 1 <= month <= 12:
+                        self.months[month - 1] += 1
+
+        if "xp" in self.reports or "levels" in self.reports:
+            if np is not None:
+                self._add_histograms_numpy(xps)
+            else:
+                self._add_histograms(xps)
+
+    def _add_top(self, guild_ids, user_ids, xps):
+        candidates = range(len(xps))
+        if np is not None and len(xps) > self.top_k:
+            # Only the batch's own top K (ties included) can reach the overall top K
+            values = np.asarray(xps, dtype=np.int64)
+            cutoff = np.partition(values, -self.top_k)[-self.top_k]
+            if len(self.top) == self.top_k:
+                cutoff = max(cutoff, self.top[0][0])
+            candidates = np.flatnonzero(values >= cutoff).tolist()
+        for i in candidates:
+            entry = (xps[i], guild_ids[i], user_ids[i])
+            if len(self.top) < self.top_k:
+                heapq.heappush(self.top, entry)
+            elif entry > self.top[0]:
+                heapq.heapreplace(self.top, entry)
+
+    def _add_histograms(self, xps):
+        for xp in xps:
+            if "xp" in self.reports:
+                bucket = max(xp, 0).bit_length()
+                self.xp_buckets[bucket] = self.xp_buckets.get(bucket, 0) + 1
+            if "levels" in self.reports:
+                level = self.curve.level(xp)
+                self.levels[level] = self.levels.get(level, 0) + 1
+
+    def _add_histograms_numpy(self, xps):
+        values = np.maximum(np.asarray(xps, dtype=np.int64), 0)
+        if "xp" in self.reports:
+            # frexp's exponent is the bit length (0 for 0), exact below 2**53
+            _, buckets = np.frexp(values)
+            _merge_counts(self.xp_buckets, np.bincount(buckets))
+        if "levels" in self.reports and len(values):
+            self.curve.cover(int(values.max()))
+            levels = np.searchsorted(self.curve.thresholds, values, side="right") + 1
+            _merge_counts(self.levels, np.bincount(levels))
+
+    def top_entries(self):
+        """Return [(xp, guild_id or None, user_id)] sorted by XP, highest first."""
+        if self.per_user:
+            best = heapq.nlargest(
+                self.top_k, self.user_totals.items(), key=lambda item: item[1]
+            )
+            return [(xp, None, user_id) for user_id, xp in best]
+        return sorted(self.top, reverse=True)
+
+
+def _merge_counts(counts, bincount):
+    for value in np.flatnonzero(bincount).tolist():
+        counts[value] = counts.get(value, 0) + int(bincount[value])
+
+
+def analyze_snapshot(
+    path, reports=REPORTS, guild_id=None, top_k=DEFAULT_TOP_K, per_user=False
+):
+    """Stream the snapshot at `path` through SnapshotStats. Returns (header, stats).
+
+    Raises SnapshotError if the snapshot is unreadable or fails its checksum.
+    """
+    stats = SnapshotStats(reports, top_k, per_user)
+    records = iter_snapshot(path)
+    header = next(records)
+    next(records, None)  # Settings are not analyzed
+
+    batch = ([], [], [], [])
+    try:
+        for record in records:
+            if guild_id and record["guild_id"] != guild_id:
+                continue
+            batch[0].append(record["guild_id"])
+            batch[1].append(record["user_id"])
+            batch[2].append(int(record.get("xp") or 0))
+            batch[3].append(record.get("bdate") or "")
+            if len(batch[0]) >= ANALYZE_BATCH_SIZE:
+                stats.add_batch(*batch)
+                batch = ([], [], [], [])
+    except (KeyError, TypeError, ValueError) as e:
+        raise SnapshotError(f"unreadable snapshot: {e}") from e
+    if batch[0]:
+        stats.add_batch(*batch)
+    return header, stats
+
+
+def _xp_bucket_label(bucket):
+    if bucket == 0:
+        return "0"
+    low, high = 2 ** (bucket - 1), 2**bucket - 1
+    return str(low) if low == high else f"{low}-{high}"
+
+
+def _bar(count, largest, width=40):
+    return "#" * max(1, round(width * count / largest)) if count else ""
+
+
+def print_report(header, stats):
+    print(
+        f"Snapshot from {header['created']}: {stats.users} users analyzed "
+        f"({header['users']} users in {header['guilds']} guilds)"
+    )
+
+    if "top" in stats.reports:
+        if stats.per_user:
+            title = "Top users (XP summed across guilds)"
+        else:
+            title = "Top members"
+        print(f"\n--- {title} ---")
+        print(f"{'Rank':<6} {'Guild ID':<20} {'User ID':<20} {'XP':<10}")
+        print("-" * 58)
+        for rank, (xp, guild_id, user_id) in enumerate(stats.top_entries(), 1):
+            print(f"{rank:<6} {guild_id or '-':<20} {user_id:<20} {xp:<10}")
+
+    if "xp" in stats.reports and stats.xp_buckets:
+        print("\n--- XP distribution ---")
+        largest = max(stats.xp_buckets.values())
+        for bucket in range(max(stats.xp_buckets) + 1):
+            count = stats.xp_buckets.get(bucket, 0)
+            label = _xp_bucket_label(bucket)
+            print(f"{label:>22} {count:>10} {_bar(count, largest)}")
+
+    if "levels" in stats.reports and stats.levels:
+        print("\n--- Level distribution ---")
+        largest = max(stats.levels.values())
+        for level in range(min(stats.levels), max(stats.levels) + 1):
+            count = stats.levels.get(level, 0)
+            print(f"Level {level:<5} {count:>10} {_bar(count, largest)}")
+
+    if "birthdays" in stats.reports:
+        print("\n--- Birthdays per month ---")
+        largest = max(stats.months) or 1
+        for month, count in zip(MONTHS, stats.months):
+            print(f"{month:<10} {count:>10} {_bar(count, largest)}")
+
+
+def report_json(header, stats):
+    result = {"snapshot": header["created"], "users": stats.users}
+    if "top" in stats.reports:
+        result["top"] = [
+            {"guild_id": guild_id, "user_id": user_id, "xp": xp}
+            for xp, guild_id, user_id in stats.top_entries()
+        ]
+    if "xp" in stats.reports:
+        result["xp_histogram"] = {
+            _xp_bucket_label(bucket): count
+            for bucket, count in sorted(stats.xp_buckets.items())
+        }
+    if "levels" in stats.reports:
+        result["levels"] = {
+            str(level): count for level, count in sorted(stats.levels.items())
+        }
+    if "birthdays" in stats.reports:
+        result["birthdays_per_month"] = dict(zip(MONTHS, stats.months))
+    return result
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog="python analyze_data.py",
+        description="Offline analytics over a local store snapshot.",
+    )
+    parser.add_argument(
+        "reports",
+        nargs="*",
+        help=f"Reports to compute: {', '.join(REPORTS)} (default: all)",
+    )
+    parser.add_argument("--snapshot", help="Snapshot file (default: the newest one)")
+    parser.add_argument("--guild", help="Only analyze this guild ID")
+    parser.add_argument(
+        "-k", type=int, default=DEFAULT_TOP_K, help="Size of the top list"
+    )
+    parser.add_argument(
+        "--per-user",
+        action="store_true",
+        help="Rank users by their XP summed across guilds",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    options = parser.parse_args(args)
+    # Checked here: argparse rejects an empty list when nargs="*" has choices
+    for report in options.reports:
+        if report not in REPORTS:
+            choices = ", ".join(REPORTS)
+            parser.error(f"unknown report '{report}' (choose from {choices})")
+    return options
+
+
+def main():
+    options = parse_args(sys.argv[1:])
+
+    path = options.snapshot
+    if path is None:
+        snapshots = list_snapshots(SNAPSHOT_DIR)
+        if not snapshots:
+            print(f"No snapshots in {SNAPSHOT_DIR}.", file=sys.stderr)
+            return 1
+        path = snapshots[0][1]
+
+    print(f"Analyzing {path}...", file=sys.stderr)
+    try:
+        header, stats = analyze_snapshot(
+            path,
+            options.reports or REPORTS,
+            options.guild,
+            max(1, options.k),
+            options.per_user,
+        )
+    except SnapshotError as e:
+        print(f"Cannot analyze {path}: {e}", file=sys.stderr)
+        return 1
+
+    if options.json:
+        print(json.dumps(report_json(header, stats), indent=4))
+    else:
+        print_report(header, stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
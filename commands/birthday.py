@@ -1,4 +1,5 @@
-import asyncio
+import csv
+import io
 import json
 import os
 from discord import app_commands
@@ -6,13 +7,22 @@ import discord
 from datetime import datetime
 from utils.birthday import (
     add_or_update_birthday,
+    apply_birthday_import,
+    iter_import_rows,
+    prepare_birthday_import,
+    MAX_IMPORT_BYTES,
     get_updated_guild_birthdays,
     save_birthdays,
     delete_birthday,
-    get_zodiac,
+    format_upcoming_birthdays,
+    get_guild_timezone,
+    get_upcoming_birthdays,
+    MAX_UPCOMING_DAYS,
 )
 from utils.const import SETTINGS_FILE
 from utils.client import setup_client
+from utils.jobs import schedule_job_in
+from utils.store import get_store
 
 # Initialize or load settings data
 if not os.path.exists(SETTINGS_FILE):
@@ -68,6 +78,77 @@ async def add_birthday(
     )
 
 
+# Slash Command to Import Birthdays from a file (Admins only)
+@tree.command(
+    name="import-birthdays",
+    description="Import birthdays from a CSV or JSON file (Admins only)",
+)
+@app_commands.describe(
+    file="CSV with user,bdate rows or JSON {user: bdate}; user is an ID, mention or name"
+)
+async def import_birthdays(interaction: discord.Interaction, file: discord.Attachment):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message(
+            "You need to be an administrator to use this command.", ephemeral=True
+        )
+        return
+
+    if not file.filename.lower().endswith((".csv", ".json")):
+        await interaction.response.send_message(
+            "Please attach a `.csv` or `.json` file.", ephemeral=True
+        )
+        return
+    if file.size > MAX_IMPORT_BYTES:
+        await interaction.response.send_message(
+            f"The file is too large (max {MAX_IMPORT_BYTES // 1024} KB).",
+            ephemeral=True,
+        )
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    try:
+        text = (await file.read()).decode("utf-8-sig")
+        accepted, rejected = prepare_birthday_import(
+            interaction.guild, iter_import_rows(file.filename, text)
+        )
+    except (UnicodeDecodeError, ValueError, csv.Error) as e:
+        # json.JSONDecodeError is a ValueError
+        await interaction.followup.send(f"Could not read the file: {e}", ephemeral=True)
+        return
+    except discord.HTTPException as e:
+        await interaction.followup.send(
+            f"Could not download the file: {e}", ephemeral=True
+        )
+        return
+
+    changed = apply_birthday_import(interaction.guild.id, accepted)
+
+    response = (
+        f"Imported {len(accepted)} birthday(s) ({changed} new or changed), "
+        f"rejected {len(rejected)} row(s)."
+    )
+    if not rejected:
+        await interaction.followup.send(response, ephemeral=True)
+        return
+
+    # Attach every rejected row so they can be fixed and imported again
+    report = io.StringIO()
+    writer = csv.writer(report)
+    writer.writerow(["row", "user", "reason"])
+    writer.writerows(rejected)
+    preview = "\n".join(
+        f"{label}: {user} - {reason}" for label, user, reason in rejected[:5]
+    )
+    await interaction.followup.send(
+        f"{response}\n```\n{preview}\n```",
+        file=discord.File(
+            io.BytesIO(report.getvalue().encode()), filename="rejected_birthdays.csv"
+        ),
+        ephemeral=True,
+    )
+
+
 # Slash Command to Remove a Birthday
 @tree.command(
     name="remove-birthday", description="Remove a birthday for a user (Admins only)"
@@ -156,15 +237,97 @@ async def test_birthday(interaction: discord.Interaction, user: discord.Member):
             ephemeral=True,
         )
 
-    # Wait for 30 seconds and then remove the role
-    await asyncio.sleep(30)
-    await user.remove_roles(role)
+    # Remove the role after 30 seconds (durable, so a restart does not leave it assigned)
+    schedule_job_in(
+        "remove_birthday_role",
+        30,
+        {"guild_id": guild.id, "user_id": user.id, "role_id": role.id},
+    )
     await interaction.followup.send(
-        f"Removed the role `{role.name}` from {user.name}. Test completed.",
+        f"The role `{role.name}` will be removed from {user.name} in 30 seconds.",
         ephemeral=True,
     )
 
 
+#####################################################################################################
+# Paginated birthday list
+BIRTHDAYS_PER_PAGE = 20
+
+
+class BirthdayListView(discord.ui.View):
+    """Previous/next buttons over the guild's birthday listing, one page per embed."""
+
+    def __init__(self, guild: discord.Guild, owner_id: int):
+        super().__init__(timeout=300)
+        self.guild = guild
+        self.owner_id = owner_id
+        self.page = 0
+        # (member, month, day, zodiac) of current members only, taken once from the sorted
+        # listing, so every page is full (members who left still have a stored birthday)
+        self.entries = [
+            (member, month, day, zodiac)
+            for month, day, user_id, zodiac in get_store().birthday_page(
+                guild.id, 0, get_store().birthday_count(guild.id)
+            )
+            if (member := guild.get_member(user_id)) is not None
+        ]
+        self._update_buttons()
+
+    def page_count(self):
+        return max(1, -(-len(self.entries) // BIRTHDAYS_PER_PAGE))
+
+    def build_embed(self):
+        self.page = min(self.page, self.page_count() - 1)
+        start = self.page * BIRTHDAYS_PER_PAGE
+        entries = self.entries[start : start + BIRTHDAYS_PER_PAGE]
+
+        lines = []
+        for member, month, day, zodiac in entries:
+            # Use fixed-width format for alignment
+            bdate = f"{day:02d}-{month:02d}"
+            lines.append(f"{member.name[:15].ljust(15)}{bdate.ljust(10)}{zodiac}")
+
+        embed = discord.Embed(
+            title="🎂 Birthdays in this server",
+            description="```\n"
+            + ("\n".join(lines) or "No current members have a birthday set.")
+            + "\n```",
+            color=discord.Color(0x000000),  # Black background
+        )
+        embed.set_footer(text=f"Page {self.page + 1}/{self.page_count()}")
+        return embed
+
+    def _update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.page_count() - 1
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message(
+                "Only the person who ran the command can change pages.", ephemeral=True
+            )
+            return False
+        return True
+
+    async def _show(self, interaction: discord.Interaction, page: int):
+        self.page = page
+        embed = self.build_embed()
+        self._update_buttons()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(
+        self, interaction: discord.Interaction, button: discord.ui.Button
+    ):
+        await self._show(interaction, max(0, self.page - 1))
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(
+        self, interaction: discord.Interaction, button: discord.ui.Button
+    ):
+        await self._show(interaction, self.page + 1)
+
+
 #####################################################################################################
 # Slash Command to List Birthdays (Admins only)
 @tree.command(
@@ -178,54 +341,49 @@ async def list_birthdays(interaction: discord.Interaction):
         )
         return
 
-    guild_id = str(interaction.guild.id)
-
-    # Check if the guild has any birthdays recorded
-    guild_birthdays = get_updated_guild_birthdays(guild_id)
-    if not guild_birthdays:
+    # The store keeps every guild's birthdays sorted by date, so a page is just a slice
+    if not get_store().birthday_count(interaction.guild.id):
         await interaction.response.send_message(
             "No birthdays found for this server.", ephemeral=True
         )
         return
 
-    # Filter and sort the birthdays by day and month
-    sorted_birthdays = sorted(
-        (
-            (user_id, data)
-            for user_id, data in guild_birthdays.items()
-            if data.get("bdate") not in ("Unknown", None)
-        ),
-        key=lambda x: (
-            int(x[1]["bdate"].split("-")[1]),
-            int(x[1]["bdate"].split("-")[0]),
-        ),
+    view = BirthdayListView(interaction.guild, interaction.user.id)
+    if not view.entries:
+        await interaction.response.send_message(
+            "No birthdays found for this server.", ephemeral=True
+        )
+        return
+    await interaction.response.send_message(
+        embed=view.build_embed(), view=view, ephemeral=False
     )
 
-    # Format the list of birthdays
-    # Format the list of birthdays
-    response = "**🎂 Birthdays in this server:**\n```"
-    # response += f"{'Name'.ljust(15)}{'Birthday'.ljust(10)}{'Zodiac'}\n"
-    # response += f"{'-' * 15}{'-' * 10}{'-' * 7}\n"
 
-    for user_id, data in sorted_birthdays:
-        day, month = map(int, data["bdate"].split("-"))
-
-        if day < 10:
-            day = f"0{day}"
-        if month < 10:
-            month = f"0{month}"
-
-        data["bdate"] = f"{day}-{month}"
-
-        zodiac_icon = get_zodiac(int(day), int(month))
-        member = interaction.guild.get_member(int(user_id))
-        member_name = member.name if member else "Unknown Member"
-        if member_name == "Unknown Member":
-            continue
-        # Use fixed-width format for alignment
-        response += (
-            f"{member_name[:15].ljust(15)}{data['bdate'].ljust(10)}{zodiac_icon}\n"
+#####################################################################################################
+# Slash Command to List Upcoming Birthdays
+@tree.command(
+    name="upcoming-birthdays",
+    description="List birthdays coming up in the next few days.",
+)
+@app_commands.describe(days="How many days ahead to look, including today (default 7)")
+async def upcoming_birthdays(
+    interaction: discord.Interaction,
+    days: app_commands.Range[int, 1, MAX_UPCOMING_DAYS] = 7,
+):
+    guild = interaction.guild
+    today = datetime.now(get_guild_timezone(guild.id)).date()
+    lines = format_upcoming_birthdays(
+        guild, get_upcoming_birthdays(guild.id, days, today), today
+    )
+    if not lines:
+        await interaction.response.send_message(
+            f"No birthdays in the next {days} day(s).", ephemeral=True
         )
+        return
 
-    response += "```"  # Close code block for monospace font
-    await interaction.response.send_message(response, ephemeral=False)
+    embed = discord.Embed(
+        title=f"🎂 Birthdays in the next {days} day(s)",
+        description="\n".join(lines),
+        color=discord.Color(0x000000),  # Black background
+    )
+    await interaction.response.send_message(embed=embed)
@@ -15,7 +15,11 @@ from utils.leveling import (
     calculate_level_and_thresholds,
     calculate_user_rank,
 )
-from utils.data import load_data, save_data
+from utils.store import get_store
+from utils.ranking import get_user_profile
+from utils.level_roles import queue_level_roles, queue_reward_role_removal
+from utils.xp_rules import MAX_MULTIPLIER, refresh_xp_rules
+from utils.xp_windows import PERIOD_LABELS, top_xp_gains
 
 
 # Slash command to display the current user's XP and level
@@ -30,8 +34,8 @@ async def xp(interaction: discord.Interaction, user: discord.User = None):
     user_id = user.id
     guild_id = interaction.guild.id
 
-    # Load the data
-    data = load_data()
+    # Read the data from the shared store
+    data = get_store().guilds
     guild_id_str = str(guild_id)
     user_id_str = str(user_id)
 
@@ -78,12 +82,27 @@ async def xp(interaction: discord.Interaction, user: discord.User = None):
 @tree.command(
     name="leaderboard", description="Display the XP leaderboard for the server."
 )
-async def leaderboard(interaction: discord.Interaction):
+@app_commands.describe(period="Time window to rank by (default: all time)")
+@app_commands.choices(
+    period=[
+        app_commands.Choice(name="All time", value="all"),
+        app_commands.Choice(name="Today", value="day"),
+        app_commands.Choice(name="This week", value="week"),
+        app_commands.Choice(name="This month", value="month"),
+    ]
+)
+async def leaderboard(
+    interaction: discord.Interaction, period: app_commands.Choice[str] = None
+):
     """Generate and send the XP leaderboard as an embed."""
     guild_id = interaction.guild.id
 
-    # Load the data
-    data = load_data()
+    if period is not None and period.value != "all":
+        await send_period_leaderboard(interaction, period.value)
+        return
+
+    # Read the data from the shared store
+    data = get_store().guilds
     guild_id_str = str(guild_id)
 
     if guild_id_str not in data:
@@ -146,9 +165,81 @@ async def leaderboard(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 
+async def send_period_leaderboard(interaction: discord.Interaction, period: str):
+    """Send the leaderboard of XP gained within a rolling time window."""
+    top_users = top_xp_gains(interaction.guild.id, period, limit=10)
+
+    if not top_users:
+        await interaction.response.send_message(
+            "No XP has been gained in this period yet.", ephemeral=True
+        )
+        return
+
+    embed = discord.Embed(
+        title=f"XP Leaderboard - {PERIOD_LABELS[period]}",
+        description="Most XP gained in the server",
+        color=discord.Color(0x000000),  # Black background
+    )
+
+    for rank, (user_id, gained) in enumerate(top_users, start=1):
+        user = interaction.guild.get_member(user_id)
+        username = user.display_name if user else "Unknown User"
+
+        embed.add_field(
+            name=f"**#{rank}** -  {username}",
+            value=f"+{gained} XP",
+            inline=False,
+        )
+
+    await interaction.response.send_message(embed=embed)
+
+
+@tree.command(
+    name="profile", description="Show a user's XP standing across every server."
+)
+async def profile(interaction: discord.Interaction, user: discord.User = None):
+    """Send the user's per-server ranks and their global rank as an embed."""
+    if user is None:
+        user = interaction.user
+
+    user_profile = get_user_profile(user.id)
+    if user_profile is None:
+        await interaction.response.send_message(
+            "No XP data found for this user.", ephemeral=True
+        )
+        return
+
+    embed = discord.Embed(
+        title=f"{user.display_name}'s Profile",
+        description=(
+            f"Global rank **#{user_profile['global_rank']}** of "
+            f"{user_profile['global_users']} - {user_profile['total_xp']} XP in total"
+        ),
+        color=discord.Color(0x000000),  # Black background
+    )
+    embed.set_thumbnail(url=user.display_avatar.url)
+
+    # Only list the top servers to stay within the embed field limit
+    for guild_id, guild_xp, guild_rank, ranked in user_profile["guilds"][:10]:
+        guild = interaction.client.get_guild(guild_id)
+        guild_name = guild.name if guild else "Unknown Server"
+        level, _, _ = calculate_level_and_thresholds(guild_xp)
+
+        embed.add_field(
+            name=guild_name,
+            value=f"Rank #{guild_rank} of {ranked} - Level {level} - {guild_xp} XP",
+            inline=False,
+        )
+
+    await interaction.response.send_message(embed=embed)
+
+
 @tree.command(name="enable-xp", description="Enable XP tracking for a channel.")
 @app_commands.checks.has_permissions(administrator=True)
-async def enable_xp(interaction: discord.Interaction, channel: discord.TextChannel):
+async def enable_xp(
+    interaction: discord.Interaction,
+    channel: discord.TextChannel | discord.VoiceChannel,
+):
     """Enable XP tracking for a channel."""
     guild_id = interaction.guild.id
     channel_id = channel.id
@@ -171,6 +262,7 @@ async def enable_xp(interaction: discord.Interaction, channel: discord.TextChann
         settings[guild_id_str]["ignore_channel"].remove(channel_id)
         with open(SETTINGS_FILE, "w") as f:
             json.dump(settings, f, indent=4)
+        refresh_xp_rules(guild_id, settings[guild_id_str])
         await interaction.response.send_message(
             f"Channel {channel.mention} has been enabled for XP tracking.",
             ephemeral=True,
@@ -184,7 +276,10 @@ async def enable_xp(interaction: discord.Interaction, channel: discord.TextChann
 
 @tree.command(name="disable-xp", description="Disable XP tracking for a channel.")
 @app_commands.checks.has_permissions(administrator=True)
-async def disable_xp(interaction: discord.Interaction, channel: discord.TextChannel):
+async def disable_xp(
+    interaction: discord.Interaction,
+    channel: discord.TextChannel | discord.VoiceChannel,
+):
     """Disable XP tracking for a channel."""
     guild_id = interaction.guild.id
     channel_id = channel.id
@@ -207,6 +302,7 @@ async def disable_xp(interaction: discord.Interaction, channel: discord.TextChan
         settings[guild_id_str]["ignore_channel"].append(channel_id)
         with open(SETTINGS_FILE, "w") as f:
             json.dump(settings, f, indent=4)
+        refresh_xp_rules(guild_id, settings[guild_id_str])
         await interaction.response.send_message(
             f"Channel {channel.mention} has been disabled for XP tracking.",
             ephemeral=True,
@@ -216,3 +312,179 @@ async def disable_xp(interaction: discord.Interaction, channel: discord.TextChan
             f"Channel {channel.mention} is already disabled for XP tracking.",
             ephemeral=True,
         )
+
+
+@tree.command(
+    name="xp-multiplier",
+    description="Set an XP multiplier for a channel, a role or an hour range.",
+)
+@app_commands.describe(
+    multiplier=f"XP multiplier between 0 and {MAX_MULTIPLIER:g} (1 removes the rule)",
+    channel="Channel (or category, for all its channels) the multiplier applies to",
+    role="Role the multiplier applies to (a member's best role counts)",
+    start_hour="Start of the hour range in UTC (0-23)",
+    end_hour="End of the hour range in UTC (0-23, exclusive)",
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def xp_multiplier(
+    interaction: discord.Interaction,
+    multiplier: app_commands.Range[float, 0.0, MAX_MULTIPLIER],
+    channel: discord.abc.GuildChannel = None,
+    role: discord.Role = None,
+    start_hour: app_commands.Range[int, 0, 23] = None,
+    end_hour: app_commands.Range[int, 0, 23] = None,
+):
+    """Add, change or remove (multiplier 1) one XP multiplier rule."""
+    has_hours = start_hour is not None or end_hour is not None
+    if [channel is not None, role is not None, has_hours].count(True) != 1:
+        await interaction.response.send_message(
+            "Pick exactly one target: a channel, a role or an hour range.",
+            ephemeral=True,
+        )
+        return
+
+    if has_hours and (start_hour is None or end_hour is None or start_hour == end_hour):
+        await interaction.response.send_message(
+            "An hour range needs both a start and a different end hour.",
+            ephemeral=True,
+        )
+        return
+
+    if channel is not None:
+        kind, key, label = "channels", str(channel.id), channel.mention
+    elif role is not None:
+        kind, key, label = "roles", str(role.id), f"`{role.name}`"
+    else:
+        kind, key = "hours", f"{start_hour}-{end_hour}"
+        label = f"{start_hour:02d}:00-{end_hour:02d}:00 UTC"
+
+    # Load the settings
+    with open(SETTINGS_FILE, "r") as f:
+        settings = json.load(f)
+    guild_id_str = str(interaction.guild.id)
+
+    # Ensure the guild settings and the multiplier tables exist
+    guild_settings = settings.setdefault(guild_id_str, {})
+    rules = guild_settings.setdefault("xp_multipliers", {})
+    table = rules.setdefault(kind, {})
+
+    if multiplier == 1:
+        table.pop(key, None)
+        message = f"Removed the XP multiplier for {label}."
+    else:
+        table[key] = multiplier
+        message = f"XP multiplier for {label} set to x{multiplier:g}."
+
+    with open(SETTINGS_FILE, "w") as f:
+        json.dump(settings, f, indent=4)
+    refresh_xp_rules(interaction.guild.id, guild_settings)
+
+    await interaction.response.send_message(message, ephemeral=True)
+
+
+@tree.command(
+    name="clear-xp-multipliers", description="Remove every XP multiplier rule."
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def clear_xp_multipliers(interaction: discord.Interaction):
+    """Remove all channel, role and hour multipliers for the server."""
+    # Load the settings
+    with open(SETTINGS_FILE, "r") as f:
+        settings = json.load(f)
+    guild_id_str = str(interaction.guild.id)
+
+    guild_settings = settings.setdefault(guild_id_str, {})
+    guild_settings.pop("xp_multipliers", None)
+
+    with open(SETTINGS_FILE, "w") as f:
+        json.dump(settings, f, indent=4)
+    refresh_xp_rules(interaction.guild.id, guild_settings)
+
+    await interaction.response.send_message(
+        "All XP multipliers have been removed.", ephemeral=True
+    )
+
+
+@tree.command(
+    name="level-role", description="Reward a role when members reach a level."
+)
+@app_commands.describe(
+    level="The level that unlocks the role",
+    role="The role to reward (leave empty to remove this level's reward)",
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def level_role(
+    interaction: discord.Interaction,
+    level: app_commands.Range[int, 1, 1000],
+    role: discord.Role = None,
+):
+    """Set or remove the reward role for a level."""
+    # Load the settings
+    with open(SETTINGS_FILE, "r") as f:
+        settings = json.load(f)
+    guild_id_str = str(interaction.guild.id)
+
+    guild_settings = settings.setdefault(guild_id_str, {})
+    level_roles = guild_settings.setdefault("level_roles", {})
+
+    old_role_id = level_roles.get(str(level))
+    if role is None:
+        if level_roles.pop(str(level), None) is None:
+            await interaction.response.send_message(
+                f"There is no role reward for level {level}.", ephemeral=True
+            )
+            return
+        message = f"Removed the role reward for level {level}."
+    else:
+        if role.managed or role >= interaction.guild.me.top_role:
+            await interaction.response.send_message(
+                f"I can't assign `{role.name}`. Move my role above it first.",
+                ephemeral=True,
+            )
+            return
+        level_roles[str(level)] = role.id
+        message = f"Members reaching level {level} will get `{role.name}`."
+
+    with open(SETTINGS_FILE, "w") as f:
+        json.dump(settings, f, indent=4)
+    refresh_xp_rules(interaction.guild.id, guild_settings)
+
+    # The role that no longer rewards this level is taken back from its holders
+    if old_role_id is not None and old_role_id != level_roles.get(str(level)):
+        removed = queue_reward_role_removal(
+            interaction.client, interaction.guild, old_role_id
+        )
+        if removed:
+            message += f" The old reward role is being removed from {removed} member(s)."
+
+    await interaction.response.send_message(
+        message + " Run `/sync-level-roles` to update existing members.",
+        ephemeral=True,
+    )
+
+
+@tree.command(
+    name="sync-level-roles",
+    description="Reconcile every member's level reward roles.",
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def sync_level_roles(interaction: discord.Interaction):
+    """Queue reward role changes for every member whose roles don't match their level."""
+    guild = interaction.guild
+    guild_data = get_store().get_guild(guild.id)
+
+    queued = 0
+    for member in guild.members:
+        if member.bot:
+            continue
+        xp = guild_data.get(str(member.id), {}).get("xp", 0)
+        if not isinstance(xp, int):
+            xp = 0
+        level, _, _ = calculate_level_and_thresholds(xp)
+        if queue_level_roles(interaction.client, member, level):
+            queued += 1
+
+    await interaction.response.send_message(
+        f"Queued role updates for {queued} member(s). They will be applied in the background.",
+        ephemeral=True,
+    )
@@ -4,6 +4,13 @@ import os
 from discord import app_commands
 from utils.const import SETTINGS_FILE
 from utils.client import setup_client
+from utils.birthday import (
+    ensure_guild_birthdays,
+    reload_settings,
+    schedule_guild_birthdays,
+)
+from utils.xp_rules import refresh_xp_rules
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
 
 client, tree = setup_client()
 
@@ -15,6 +22,14 @@ with open(SETTINGS_FILE, "r") as f:
     settings = json.load(f)
 
 
+def reload_setup_settings():
+    """Refresh this module's settings copy from disk."""
+    with open(SETTINGS_FILE, "r") as f:
+        fresh = json.load(f)
+    settings.clear()
+    settings.update(fresh)
+
+
 #####################################################################################################
 # Setup commands
 @tree.command(
@@ -27,6 +42,7 @@ with open(SETTINGS_FILE, "r") as f:
     data_channel="The channel for collecting birthday data",
     announcement_channel="The channel for level-up announcements (optional)",
     level_flag="Set to true to enable the level-up system, false to disable (optional)",
+    birthday_digest="Post a weekly list of upcoming birthdays on Mondays (optional)",
 )
 async def app_setup(
     interaction: discord.Interaction,
@@ -35,6 +51,7 @@ async def app_setup(
     data_channel: discord.TextChannel,
     announcement_channel: discord.TextChannel = None,
     level_flag: bool = True,
+    birthday_digest: bool = False,
 ):
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message(
@@ -42,6 +59,9 @@ async def app_setup(
         )
         return
 
+    # Reload first so settings written by other commands since startup are kept
+    reload_setup_settings()
+
     guild_id = str(interaction.guild.id)
     if guild_id not in settings:
         settings[guild_id] = {}
@@ -54,10 +74,15 @@ async def app_setup(
         announcement_channel.name if announcement_channel else "Not set"
     )
     settings[guild_id]["level"] = level_flag
+    settings[guild_id]["birthday_digest"] = birthday_digest
 
     # Save settings to the file
     with open(SETTINGS_FILE, "w") as f:
         json.dump(settings, f, indent=4)
+    refresh_xp_rules(guild_id, settings[guild_id])
+    reload_settings()
+    # Birthdays start at the guild's next midnight without waiting for a restart
+    ensure_guild_birthdays(interaction.guild.id)
 
     response_message = (
         f"Birthday role set to `{birthday_role.name}`, birthday channel set to `{birthday_channel.name}`, "
@@ -70,5 +95,98 @@ async def app_setup(
     response_message += (
         f" Level-up system has been {'enabled' if level_flag else 'disabled'}."
     )
+    if birthday_digest:
+        response_message += " Upcoming birthdays will be posted every Monday."
 
     await interaction.response.send_message(response_message)
+
+
+@tree.command(
+    name="set-timezone",
+    description="Set the server timezone used for birthdays (Admin only)",
+)
+@app_commands.describe(
+    timezone="IANA timezone name, e.g. Europe/Berlin or America/New_York"
+)
+async def set_timezone(interaction: discord.Interaction, timezone: str):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message(
+            "You need to be an administrator to use this command.", ephemeral=True
+        )
+        return
+
+    try:
+        ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        await interaction.response.send_message(
+            f"Unknown timezone `{timezone}`. Use a name like `Europe/Berlin`.",
+            ephemeral=True,
+        )
+        return
+
+    reload_setup_settings()
+    guild_id = str(interaction.guild.id)
+    if guild_id not in settings:
+        settings[guild_id] = {}
+    settings[guild_id]["timezone"] = timezone
+
+    # Save settings to the file
+    with open(SETTINGS_FILE, "w") as f:
+        json.dump(settings, f, indent=4)
+    reload_settings()
+
+    # Move this server's next birthday run to midnight in the new timezone
+    schedule_guild_birthdays(interaction.guild.id)
+
+    await interaction.response.send_message(
+        f"Timezone set to `{timezone}`. Birthdays will be celebrated at midnight local time."
+    )
+
+
+@tree.command(
+    name="set-retention",
+    description="Days to keep XP and birthdays of members who left (Admin only)",
+)
+@app_commands.describe(
+    days="Days before a departed member's data is archived (0 = at the next cleanup)"
+)
+async def set_retention(
+    interaction: discord.Interaction, days: app_commands.Range[int, 0, 365]
+):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message(
+            "You need to be an administrator to use this command.", ephemeral=True
+        )
+        return
+
+    reload_setup_settings()
+    guild_id = str(interaction.guild.id)
+    if guild_id not in settings:
+        settings[guild_id] = {}
+    settings[guild_id]["retention_days"] = days
+
+    # Save settings to the file
+    with open(SETTINGS_FILE, "w") as f:
+        json.dump(settings, f, indent=4)
+    reload_settings()
+
+    await interaction.response.send_message(
+        f"Data of members who leave will be kept for {days} day(s) before it is archived."
+    )
+
+
+@set_timezone.autocomplete("timezone")
+async def set_timezone_autocomplete(interaction: discord.Interaction, current: str):
+    current = current.lower()
+    matches = sorted(tz for tz in _timezone_names() if current in tz.lower())
+    return [app_commands.Choice(name=tz, value=tz) for tz in matches[:25]]
+
+
+_timezones = None
+
+
+def _timezone_names():
+    global _timezones
+    if _timezones is None:
+        _timezones = available_timezones()
+    return _timezones
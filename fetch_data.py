@@ -1,104 +1,166 @@
+import argparse
 import asyncio
-import aiomysql
+import csv
+import json
 import sys
-from utils.const import DB_CONFIG
+import aiomysql
+from utils.db import close_pool, get_connection
 
 # Usage:
 #   python fetch_data.py user <user_id> [guild_id]  - Fetch user data
-#   python fetch_data.py all                        - Fetch all users
+#   python fetch_data.py all [--guild ID] [--limit N] [--offset N]
+#                            [--format table|csv|jsonl] [--output FILE]
+#                                                   - Export all users (streamed)
 #   python fetch_data.py leaderboard <guild_id> [limit] - Fetch guild leaderboard
 
-
-async def get_database_connection():
-    """Create and return a database connection."""
-    if not DB_CONFIG:
-        print("Database configuration not loaded")
-        return None
-
-    try:
-        connection = await aiomysql.connect(**DB_CONFIG)
-        return connection
-    except Exception as e:
-        print(f"Database connection error: {e}")
-        return None
+EXPORT_FORMATS = ("table", "csv", "jsonl")
+# Rows fetched per round trip while streaming
+STREAM_BATCH_SIZE = 1000
+# MySQL has no OFFSET without LIMIT; this is its documented "all remaining rows" value
+NO_LIMIT = 18446744073709551615
 
 
 async def fetch_user_data(user_id, guild_id=None):
     """Fetch user data from the database."""
-    connection = await get_database_connection()
-    if not connection:
-        return None
-
-    try:
-        cursor = await connection.cursor()
+    async with get_connection() as connection:
+        if not connection:
+            return None
+
+        try:
+            cursor = await connection.cursor()
+
+            if guild_id:
+                # Fetch data for specific guild
+                await cursor.execute(
+                    "SELECT guild_id, user_id, bdate, xp FROM user_data WHERE user_id = %s AND guild_id = %s",
+                    (user_id, guild_id),
+                )
+            else:
+                # Fetch data for all guilds
+                await cursor.execute(
+                    "SELECT guild_id, user_id, bdate, xp FROM user_data WHERE user_id = %s",
+                    (user_id,),
+                )
+
+            results = await cursor.fetchall()
+            return results
+
+        except Exception as e:
+            print(f"Error fetching user data: {e}")
+            return None
+        finally:
+            await cursor.close()
+
+
+async def stream_users(
+    guild_id=None, limit=None, offset=0, batch_size=STREAM_BATCH_SIZE
+):
+    """Yield batches of (guild_id, user_id, bdate, xp) rows, highest XP first.
+
+    The rows come from an unbuffered SSCursor, so the table is never held in memory.
+    """
+    query = "SELECT guild_id, user_id, bdate, xp FROM user_data"
+    params = []
+    if guild_id:
+        query += " WHERE guild_id = %s"
+        params.append(guild_id)
+    query += " ORDER BY xp DESC"
+    if limit is not None or offset:
+        query += " LIMIT %s OFFSET %s"
+        params += [NO_LIMIT if limit is None else limit, offset]
+
+    async with get_connection() as connection:
+        if not connection:
+            raise ConnectionError("Database unavailable")
+
+        async with connection.cursor(aiomysql.SSCursor) as cursor:
+            await cursor.execute(query, params)
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield rows
+
+
+def _start_export(export_format, out):
+    """Write the header for `export_format` and return a function that writes one row."""
+    if export_format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(["guild_id", "user_id", "bdate", "xp"])
+        return writer.writerow
+
+    if export_format == "jsonl":
+
+        def write_jsonl(row):
+            guild_id, user_id, bdate, xp = row
+            record = {
+                "guild_id": str(guild_id),
+                "user_id": str(user_id),
+                "bdate": bdate,
+                "xp": xp,
+            }
+            out.write(json.dumps(record) + "\n")
 
-        if guild_id:
-            # Fetch data for specific guild
-            await cursor.execute(
-                "SELECT guild_id, user_id, bdate, xp FROM user_data WHERE user_id = %s AND guild_id = %s",
-                (user_id, guild_id),
-            )
-        else:
-            # Fetch data for all guilds
-            await cursor.execute(
-                "SELECT guild_id, user_id, bdate, xp FROM user_data WHERE user_id = %s",
-                (user_id,),
-            )
+        return write_jsonl
 
-        results = await cursor.fetchall()
-        return results
+    out.write(f"{'Guild ID':<20} {'User ID':<20} {'Birthday':<12} {'XP':<10}\n")
+    out.write("-" * 65 + "\n")
 
-    except Exception as e:
-        print(f"Error fetching user data: {e}")
-        return None
-    finally:
-        await cursor.close()
-        connection.close()
+    def write_table(row):
+        guild_id, user_id, bdate, xp = (str(value) for value in row)
+        out.write(f"{guild_id:<20} {user_id:<20} {bdate:<12} {xp:<10}\n")
 
+    return write_table
 
-async def fetch_all_users():
-    """Fetch all user data from the database."""
-    connection = await get_database_connection()
-    if not connection:
-        return None
 
+async def export_users(out, export_format="table", guild_id=None, limit=None, offset=0):
+    """Stream user data to `out` as it arrives. Returns the number of rows, or None on error."""
+    write = _start_export(export_format, out)
+    count = 0
     try:
-        cursor = await connection.cursor()
-        await cursor.execute(
-            "SELECT guild_id, user_id, bdate, xp FROM user_data ORDER BY xp DESC"
-        )
-        results = await cursor.fetchall()
-        return results
-
+        async for rows in stream_users(guild_id, limit, offset):
+            for row in rows:
+                write(row)
+            count += len(rows)
     except Exception as e:
-        print(f"Error fetching all user data: {e}")
+        print(f"Error fetching all user data: {e}", file=sys.stderr)
         return None
-    finally:
-        await cursor.close()
-        connection.close()
+    return count
+
+
+def parse_export_args(args):
+    parser = argparse.ArgumentParser(
+        prog="python fetch_data.py all",
+        description="Export user data (highest XP first), streamed row by row.",
+    )
+    parser.add_argument("--guild", help="Only export this guild ID")
+    parser.add_argument("--limit", type=int, help="Maximum number of rows")
+    parser.add_argument("--offset", type=int, default=0, help="Rows to skip first")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="table")
+    parser.add_argument("--output", help="Write to this file instead of stdout")
+    return parser.parse_args(args)
 
 
 async def fetch_guild_leaderboard(guild_id, limit=10):
     """Fetch top users for a specific guild."""
-    connection = await get_database_connection()
-    if not connection:
-        return None
+    async with get_connection() as connection:
+        if not connection:
+            return None
 
-    try:
-        cursor = await connection.cursor()
-        await cursor.execute(
-            "SELECT user_id, bdate, xp FROM user_data WHERE guild_id = %s ORDER BY xp DESC LIMIT %s",
-            (guild_id, limit),
-        )
-        results = await cursor.fetchall()
-        return results
+        try:
+            cursor = await connection.cursor()
+            await cursor.execute(
+                "SELECT user_id, bdate, xp FROM user_data WHERE guild_id = %s ORDER BY xp DESC LIMIT %s",
+                (guild_id, limit),
+            )
+            results = await cursor.fetchall()
+            return results
 
-    except Exception as e:
-        print(f"Error fetching guild leaderboard: {e}")
-        return None
-    finally:
-        await cursor.close()
-        connection.close()
+        except Exception as e:
+            print(f"Error fetching guild leaderboard: {e}")
+            return None
+        finally:
+            await cursor.close()
 
 
 async def main():
@@ -106,7 +168,10 @@ async def main():
     if len(sys.argv) < 2:
         print("Usage:")
         print("  python fetch_data.py user <user_id> [guild_id]  - Fetch user data")
-        print("  python fetch_data.py all                        - Fetch all users")
+        print(
+            "  python fetch_data.py all [--guild ID] [--limit N] [--offset N] "
+            "[--format table|csv|jsonl] [--output FILE] - Export all users"
+        )
         print(
             "  python fetch_data.py leaderboard <guild_id> [limit] - Fetch guild leaderboard"
         )
@@ -141,20 +206,27 @@ async def main():
             print(f"{guild_id:<20} {user_id:<20} {bdate:<12} {xp:<10}")
 
     elif command == "all":
-        print("Fetching all user data...")
-        results = await fetch_all_users()
-
-        if not results:
-            print("No data found.")
-            return
-
-        print(f"\n--- All Users ({len(results)} total) ---")
-        print(f"{'Guild ID':<20} {'User ID':<20} {'Birthday':<12} {'XP':<10}")
-        print("-" * 65)
+        options = parse_export_args(sys.argv[2:])
+        # Progress goes to stderr so stdout only carries the exported rows
+        print("Fetching all user data...", file=sys.stderr)
+
+        out = (
+            open(options.output, "w", newline="", encoding="utf-8")
+            if options.output
+            else sys.stdout
+        )
+        try:
+            count = await export_users(
+                out, options.format, options.guild, options.limit, options.offset
+            )
+        finally:
+            if options.output:
+                out.close()
 
-        for row in results:
-            guild_id, user_id, bdate, xp = row
-            print(f"{guild_id:<20} {user_id:<20} {bdate:<12} {xp:<10}")
+        if count == 0:
+            print("No data found.", file=sys.stderr)
+        elif count:
+            print(f"--- {count} users exported ---", file=sys.stderr)
 
     elif command == "leaderboard":
         if len(sys.argv) < 3:
@@ -184,5 +256,13 @@ async def main():
         print("Available commands: user, all, leaderboard")
 
 
+async def run_cli():
+    """Run the CLI and close the database pool before the event loop ends."""
+    try:
+        await main()
+    finally:
+        await close_pool()
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(run_cli())
@@ -14,6 +14,12 @@ from utils.const import SETTINGS_FILE, TOKEN
 
 load_dotenv()
 
+# Rebuild data.json and settings.json from the database backup if data.json is missing
+# (only with "restore_on_start": true in db_config.json)
+from utils.data_backup import restore_on_start
+
+restore_on_start()
+
 #####################################################################################################
 # Load settings data
 
@@ -33,18 +39,42 @@ client, tree = setup_client()
 #####################################################################################################
 # Import commands and functions
 
-from utils.birthday import check_birthdays, update_birthdays
+from utils.birthday import (
+    check_birthdays,
+    ensure_guild_birthdays,
+    handle_data_channel_message,
+    start_birthday_ingestion,
+)
 from utils.leveling import increase_xp_periodically
-from utils.data_backup import start_daily_backup
+from utils.voice_xp import (
+    checkpoint_voice_xp_periodically,
+    handle_voice_state_update,
+    start_voice_tracking,
+)
+from utils.data_backup import start_backups
+from utils.snapshots import start_snapshots
+from utils.jobs import run_job_scheduler
 
 from commands.birthday import (
     add_birthday,
+    import_birthdays,
     list_birthdays,
     test_birthday,
     remove_birthday,
+    upcoming_birthdays,
 )
-from commands.leveling import xp, leaderboard, disable_xp, enable_xp
-from commands.setup import app_setup
+from commands.leveling import (
+    xp,
+    leaderboard,
+    profile,
+    disable_xp,
+    enable_xp,
+    xp_multiplier,
+    clear_xp_multipliers,
+    level_role,
+    sync_level_roles,
+)
+from commands.setup import app_setup, set_retention, set_timezone
 from commands.clear import clear, clear_all
 from commands.whisper import whisper
 from commands.murmur import murmur
@@ -79,39 +109,48 @@ tree.add_command(murmur)
 # tree.add_command(clear_all)
 
 # tree.add_command(app_setup)
+# tree.add_command(set_timezone)
+# tree.add_command(set_retention)
 
 # tree.add_command(add_birthday)
+# tree.add_command(import_birthdays)
 # tree.add_command(remove_birthday)
 # tree.add_command(list_birthdays)
 # tree.add_command(test_birthday)
+# tree.add_command(upcoming_birthdays)
 
 # tree.add_command(xp)
 # tree.add_command(disable_xp)
 # tree.add_command(enable_xp)
+# tree.add_command(xp_multiplier)
+# tree.add_command(clear_xp_multipliers)
+# tree.add_command(level_role)
+# tree.add_command(sync_level_roles)
 # tree.add_command(leaderboard)
+# tree.add_command(profile)
 
 #####################################################################################################
 ### Bot events
 
-from utils.data import load_data, save_data
+from utils.members import (
+    register_all_members,
+    register_guild_members,
+    register_member,
+)
 
 
-# On member join event: add user entry to data.json
+# On member join event: add a default record in the store (saved by the periodic flush)
 # @client.event
 # async def on_member_join(member):
-#     data = load_data()
-#     guild_id = str(member.guild.id)
-#     user_id = str(member.id)
+#     register_member(member)
 
-#     # Ensure the guild entry exists
-#     if guild_id not in data:
-#         data[guild_id] = {}
 
-#     # Add the new user entry with default values
-#     if user_id not in data[guild_id]:
-#         data[guild_id][user_id] = {"bdate": "Unknown", "xp": 0}
-#         save_data(data)  # Save the updated data
-#         # print(f"Added {member} to the data file.")
+# When the bot joins a server, register all of its members in one batch and schedule its
+# birthday run
+# @client.event
+# async def on_guild_join(guild):
+#     await register_guild_members(guild)
+#     ensure_guild_birthdays(guild.id)
 
 
 # Events to handle message activity
@@ -126,25 +165,11 @@ from utils.data import load_data, save_data
 #     if message.author.bot:
 #         return
 
-#     # Load the existing data
-#     data = load_data()
-
-#     # Ensure the guild exists in the data
-#     guild_id = str(message.guild.id)
-#     if guild_id not in data:
-#         data[guild_id] = {}
-
-#     # Ensure the user exists in the guild's data
-#     user_id = str(message.author.id)
-#     if user_id not in data[guild_id]:
-#         data[guild_id][user_id] = {"bdate": "Unknown", "xp": 0}
-#     else:
-#         # Ensure "xp" and "bdate" are initialized
-#         user_data = data[guild_id][user_id]
-#         if "xp" not in user_data:
-#             user_data["xp"] = 0
-#         if "bdate" not in user_data:
-#             user_data["bdate"] = "Unknown"
+#     # Pick up birthdays posted in the data channel as they arrive
+#     await handle_data_channel_message(message)
+
+#     # Make sure the author has a record (in memory, no file I/O)
+#     register_member(message.author)
 
 #     # Ensure the guild exists in `member_last_activity`
 #     if message.guild.id not in member_last_activity:
@@ -159,8 +184,11 @@ from utils.data import load_data, save_data
 #         message.author.id
 #     ] = time.time()
 
-#     # Save the updated data
-#     save_data(data)
+
+# Voice activity XP: credited when a voice interval closes (join/leave/move/mute)
+# @client.event
+# async def on_voice_state_update(member, before, after):
+#     await handle_voice_state_update(member, before, after, client)
 
 
 @client.event
@@ -176,8 +204,15 @@ async def on_ready():
     # Indicate login status
     print(f"Logged in as {client.user}")
 
+    # Run scheduled jobs (XP ticks, birthdays, backups, delayed role removals)
+    client.loop.create_task(run_job_scheduler(client))
+
+    # Create records for members missing from the data file (one batch per guild), then
+    # flush and compact the store periodically
+    # client.loop.create_task(register_all_members(client))
+
     # Update birthday data (from data channel)
-    # update_birthdays.start(client)
+    # client.loop.create_task(start_birthday_ingestion())
 
     # Check for people birthday daily
     # client.loop.create_task(check_birthdays(client))
@@ -185,8 +220,15 @@ async def on_ready():
     # Xp
     # client.loop.create_task(increase_xp_periodically(member_last_activity, client))
 
-    # Start daily backup task
-    # client.loop.create_task(start_daily_backup())
+    # Voice XP (open intervals for members already in voice, then checkpoint long sessions)
+    # start_voice_tracking(client)
+    # client.loop.create_task(checkpoint_voice_xp_periodically(client))
+
+    # Back up changes to the database every few minutes (with a periodic full sweep)
+    # client.loop.create_task(start_backups())
+
+    # Hourly local snapshots (compressed, checksummed, rotated) for setups without a database
+    # client.loop.create_task(start_snapshots())
 
 
 client.run(TOKEN)
@@ -1,22 +1,23 @@
-from datetime import datetime, timedelta
-import asyncio
+from datetime import date, datetime, timedelta, time as dt_time
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from functools import partial
+import csv
+import io
 import json
 import os
-from discord.ext import tasks
-from utils.const import DATA_FILE, CURRENT_TIME, SETTINGS_FILE
+import re
+from utils.const import INGEST_STATE_FILE, SETTINGS_FILE, current_time
 import discord
 from discord import app_commands
 from utils.client import setup_client
+from utils.dispatch import dispatch_all
+from utils.jobs import has_job, register_job_handler, schedule_every, schedule_job
+from utils.ratelimit import call_with_backoff
+from utils.store import get_store
 
 # Set up the bot client
 # client, tree = setup_client()
 
-# Initialize or load birthday data
-if not os.path.exists(DATA_FILE):
-    with open(DATA_FILE, "w") as f:
-        json.dump({}, f)
-with open(DATA_FILE, "r") as f:
-    birthdays = json.load(f)
 # Initialize or load settings data
 if not os.path.exists(SETTINGS_FILE):
     with open(SETTINGS_FILE, "w") as f:
@@ -26,233 +27,564 @@ with open(SETTINGS_FILE, "r") as f:
 
 
 #####################################################################################################
-# Helper Functions
+# Helper Functions (birthdays live in the shared data store)
 def save_birthdays():
     """Save the updated birthday data to the file."""
-    with open(DATA_FILE, "w") as f:
-        json.dump(birthdays, f, indent=4)
+    get_store().save()
 
 
 def add_or_update_birthday(guild_id, user_id, bdate):
     """Add or update a birthday for a user in the given guild."""
-    guild_id = str(guild_id)
-    user_id = str(user_id)
-
-    if guild_id not in birthdays:
-        birthdays[guild_id] = {}
-
-    birthdays[guild_id][user_id] = {
-        "bdate": bdate,
-        "xp": birthdays.get(guild_id, {}).get(user_id, {}).get("xp", 0),
-    }
+    return get_store().set_birthday(guild_id, user_id, bdate)
 
 
 def delete_birthday(guild_id, user_id):
     """Delete a birthday for a user in the given guild."""
-    guild_id = str(guild_id)
-    user_id = str(user_id)
-
-    if guild_id in birthdays and user_id in birthdays[guild_id]:
-        del birthdays[guild_id][user_id]
-        if not birthdays[
-            guild_id
-        ]:  # If no more birthdays in the guild, remove the guild entry
-            del birthdays[guild_id]
-        save_birthdays()
+    store = get_store()
+    if store.delete_user(guild_id, user_id):
+        store.save()
         return True
     return False
 
 
 def get_updated_guild_birthdays(guild_id):
     """Retrieve all birthdays for a specific guild."""
-    with open(DATA_FILE, "r") as f:
-        birthdays = json.load(f)
-    return birthdays.get(str(guild_id), {})
+    return get_store().get_guild(guild_id)
 
 
 #####################################################################################################
 # Birthday Checker Task
-# Global variable to track the running task
-_running_birthday_task = None
+#
+# Each guild celebrates at midnight in its own timezone (settings "timezone", IANA name; server
+# local time when unset). Every guild has one durable "birthday_run" job in the job scheduler at
+# its next local midnight, so only the guilds that are due are processed and role edits are
+# spread over the day instead of bursting at one global midnight. A run that keeps failing is
+# dropped after its retries and the guild is scheduled for the next midnight instead.
+
+# Set once the startup catch-up ran (on_ready can fire again after a reconnect)
+_birthday_jobs_started = False
+
+
+def reload_settings():
+    """Refresh the module's settings from disk after a command changed them."""
+    with open(SETTINGS_FILE, "r") as f:
+        fresh = json.load(f)
+    settings.clear()
+    settings.update(fresh)
+
+
+def get_guild_timezone(guild_id):
+    """Return the guild's tzinfo, falling back to the server's local timezone."""
+    tz_name = settings.get(str(guild_id), {}).get("timezone")
+    if tz_name:
+        try:
+            return ZoneInfo(tz_name)
+        except (ZoneInfoNotFoundError, ValueError):
+            print(f"Unknown timezone '{tz_name}' for guild {guild_id}, using local time.")
+    return datetime.now().astimezone().tzinfo
+
+
+def next_local_midnight(tz, now=None):
+    """Timestamp of the next midnight in `tz`."""
+    now = datetime.now(tz) if now is None else now.astimezone(tz)
+    tomorrow = now.date() + timedelta(days=1)
+    return datetime.combine(tomorrow, dt_time.min, tzinfo=tz).timestamp()
+
+
+def schedule_guild_birthdays(guild_id):
+    """(Re)schedule a guild's next birthday run at its next local midnight."""
+    schedule_job(
+        "birthday_run",
+        next_local_midnight(get_guild_timezone(guild_id)),
+        {"guild_id": guild_id},
+        job_id=f"birthday:{guild_id}",
+    )
+
+
+def ensure_guild_birthdays(guild_id):
+    """Schedule the guild's birthday run unless it already has one (new or set-up guilds)."""
+    if not has_job(f"birthday:{guild_id}"):
+        schedule_guild_birthdays(guild_id)
+
+
+async def run_guild_birthdays(client, guild_ids, send_digest=False):
+    """Process guilds for their local "today" concurrently and print a summary.
+
+    With send_digest, guilds that opted in also get the weekly digest on their local Monday.
+    """
+    guild_actions = {}
+    for guild_id in guild_ids:
+        guild = client.get_guild(guild_id)
+        if not guild:
+            continue
+
+        local_now = datetime.now(get_guild_timezone(guild_id))
+        today = local_now.strftime("%d-%m")
+        celebrant_ids = {
+            user_id
+            for celebrant_guild_id, user_id in get_store().birthdays_on(today)
+            if celebrant_guild_id == guild_id
+        }
+        guild_actions[guild] = build_guild_birthday_actions(guild, celebrant_ids)
+
+        if send_digest and local_now.weekday() == DIGEST_WEEKDAY:
+            guild_actions[guild] += build_birthday_digest_action(guild, local_now.date())
+
+    summary = await dispatch_all(guild_actions)
+    print(
+        f"{current_time()} - Birthday run finished for {len(guild_actions)} guild(s): {summary}."
+    )
+
+
+async def _run_birthday_job(client, payload):
+    guild_id = payload["guild_id"]
+    await run_guild_birthdays(client, [guild_id], send_digest=True)
+    schedule_guild_birthdays(guild_id)
+
+
+def _give_up_birthday_job(payload):
+    schedule_guild_birthdays(payload["guild_id"])
+
+
+async def _remove_birthday_role_job(client, payload):
+    """Delayed role removal (used by /test-birthday)."""
+    guild = client.get_guild(payload["guild_id"])
+    member = guild.get_member(payload["user_id"]) if guild else None
+    role = guild.get_role(payload["role_id"]) if guild else None
+    if not member or not role or role not in member.roles:
+        return
 
+    try:
+        await call_with_backoff(partial(member.remove_roles, role))
+    except (discord.Forbidden, discord.NotFound):
+        # Retrying cannot fix missing permissions or a deleted role
+        print(f"Could not remove birthday role from {member.name} in {guild.name}.")
+        return
+    print(f"{current_time()} - Birthday role removed from {member.name}.")
 
-async def check_birthdays(client):
-    global _running_birthday_task
 
-    # Prevent duplicate tasks
-    if _running_birthday_task and not _running_birthday_task.done():
-        print(f"{CURRENT_TIME} - Birthday task already running, skipping new instance.")
-        return
+register_job_handler("birthday_run", _run_birthday_job, _give_up_birthday_job)
+register_job_handler("remove_birthday_role", _remove_birthday_role_job)
 
-    # Track the current task
-    _running_birthday_task = asyncio.current_task()
 
-    while True:
-        now = datetime.now()
-        today = now.strftime("%d-%m")
-        print(f"{CURRENT_TIME} - Checking birthdays for {today}.")
+async def check_birthdays(client):
+    """Catch up on today for guilds without a birthday job, then schedule them.
 
-        for guild_id, users in birthdays.items():
-            guild = client.get_guild(int(guild_id))
-            if not guild:
-                # print(f"Guild {guild_id} not found.")
-                continue
+    Guilds that already have a job (kept in jobs.json across restarts) are left to it: an overdue
+    one runs as soon as the scheduler starts, and running the catch-up as well would give roles
+    and post announcements twice.
+    """
+    global _birthday_jobs_started
 
-            role_name = settings.get(guild_id, {}).get("birthday_role", "Birthday")
-            role = discord.utils.get(guild.roles, name=role_name)
-            if not role:
-                # print(f"Role {role_name} not found in guild {guild_id}.")
-                continue
+    # Prevent duplicate runs
+    if _birthday_jobs_started:
+        print(f"{current_time()} - Birthday jobs already scheduled, skipping.")
+        return
+    _birthday_jobs_started = True
 
-            for user_id, data in users.items():
-                user = guild.get_member(int(user_id))
-                if not user:
-                    # print(f"User {user_id} not found in guild {guild_id}.")
-                    continue
-
-                if data["bdate"] == today:
-                    print(f"Today is {user.name}'s birthday!")
-                    if role not in user.roles:
-                        try:
-                            await user.add_roles(role)
-                            print(
-                                f"{CURRENT_TIME} - Birthday role assigned to {user.name}."
-                            )
-                        except discord.Forbidden:
-                            continue
-                        except discord.HTTPException as e:
-                            continue
-
-                        channel_name = settings.get(guild_id, {}).get(
-                            "birthday_channel", "general"
-                        )
-                        channel = discord.utils.get(guild.channels, name=channel_name)
-                        if channel:
-                            try:
-                                await channel.send(
-                                    f"🎉 Happy Birthday, {user.mention}! 🎂\n https://tenor.com/view/happy-birthday-bon-anniversaire-birthday-cake-birthday-birthday-fiesta-gif-8599251704042047456"
-                                )
-                                print(
-                                    f"{CURRENT_TIME} - Birthday message sent for {user.name}."
-                                )
-                            except discord.Forbidden:
-                                continue
-                            except discord.HTTPException as e:
-                                continue
-                elif role in user.roles:
-                    # print(f"Removing birthday role from {user.name}.")
-                    try:
-                        await user.remove_roles(role)
-                        print(
-                            f"{CURRENT_TIME} - Birthday role removed from {user.name}."
-                        )
-                    except discord.Forbidden:
-                        continue
-                    except discord.HTTPException as e:
-                        continue
-
-        # Wait until the next day
-        next_day = now + timedelta(days=1)
-        next_update = datetime.combine(next_day, datetime.min.time())
-        hours = int(((next_update - now).seconds) / 3600)
-        minutes = int(((next_update - now).seconds) / 60) % 60
-
-        if hours != 0 or minutes != 0:
-            print(
-                f"{CURRENT_TIME} - Next birthday update in {hours} hours and {minutes} minutes."
+    unscheduled = [
+        guild.id for guild in client.guilds if not has_job(f"birthday:{guild.id}")
+    ]
+    await run_guild_birthdays(client, unscheduled)
+    for guild_id in unscheduled:
+        schedule_guild_birthdays(guild_id)
+
+
+def build_guild_birthday_actions(guild, celebrant_ids):
+    """List the role edits and announcements a guild needs today as [(kind, steps)].
+
+    Work is proportional to today's celebrants plus the current role holders. Nothing is sent
+    here; the actions are run by the dispatcher.
+    """
+    guild_id = str(guild.id)
+    role_name = settings.get(guild_id, {}).get("birthday_role", "Birthday")
+    role = discord.utils.get(guild.roles, name=role_name)
+    if not role:
+        # print(f"Role {role_name} not found in guild {guild_id}.")
+        return []
+
+    channel_name = settings.get(guild_id, {}).get("birthday_channel", "general")
+    channel = discord.utils.get(guild.channels, name=channel_name)
+
+    actions = []
+
+    # Removals: only members currently holding the role
+    for user in role.members:
+        if user.id not in celebrant_ids:
+            actions.append(("birthday roles removed", [partial(user.remove_roles, role)]))
+
+    # Grants: only members from today's bucket of the birthday index
+    for user_id in celebrant_ids:
+        user = guild.get_member(user_id)
+        if not user:
+            # print(f"User {user_id} not found in guild {guild_id}.")
+            continue
+
+        print(f"Today is {user.name}'s birthday!")
+        if role in user.roles:
+            continue
+
+        # The announcement is only sent once the role was given
+        steps = [partial(user.add_roles, role)]
+        if channel:
+            steps.append(
+                partial(
+                    channel.send,
+                    f"🎉 Happy Birthday, {user.mention}! 🎂\n https://tenor.com/view/happy-birthday-bon-anniversaire-birthday-cake-birthday-birthday-fiesta-gif-8599251704042047456",
+                )
             )
+        actions.append(("birthdays celebrated", steps))
 
-        await asyncio.sleep((next_update - now).seconds)
+    return actions
+
+
+#####################################################################################################
+# Upcoming birthdays
+#
+# Range queries go through the store's per-guild listing, which is sorted in day-of-year order:
+# "the next N days" is a bisect for each end of the range (two slices when it wraps across New
+# Year), so the cost follows the number of matches, not the size of the guild.
+
+MAX_UPCOMING_DAYS = 365
+DIGEST_DAYS = 7
+DIGEST_WEEKDAY = 0  # Monday
+# Keep embeds well under Discord's description limit
+MAX_UPCOMING_LINES = 40
+
+
+def get_upcoming_birthdays(guild_id, days, today=None):
+    """Return [(date, user_id, zodiac)] for birthdays from today through the next `days` - 1 days.
+
+    29-02 is only listed in leap years, matching when the daily run celebrates it.
+    """
+    if today is None:
+        today = datetime.now(get_guild_timezone(guild_id)).date()
+    days = max(1, min(int(days), MAX_UPCOMING_DAYS))
+    end = today + timedelta(days=days - 1)
+
+    entries = get_store().birthdays_between(
+        guild_id, (today.month, today.day), (end.month, end.day)
+    )
+
+    upcoming = []
+    for month, day, user_id, zodiac in entries:
+        year = today.year if (month, day) >= (today.month, today.day) else today.year + 1
+        try:
+            bdate = date(year, month, day)
+        except ValueError:
+            continue  # 29-02 outside a leap year
+        if bdate <= end:
+            upcoming.append((bdate, user_id, zodiac))
+    return upcoming
+
+
+def format_upcoming_birthdays(guild, upcoming, today):
+    """Render upcoming birthdays as lines for an embed, skipping members who left."""
+    lines = []
+    for bdate, user_id, zodiac in upcoming:
+        member = guild.get_member(user_id)
+        if member is None:
+            continue
+        if len(lines) == MAX_UPCOMING_LINES:
+            lines.append("…and more")
+            break
+
+        days_left = (bdate - today).days
+        if days_left == 0:
+            when = "today"
+        elif days_left == 1:
+            when = "tomorrow"
+        else:
+            when = f"in {days_left} days"
+        lines.append(
+            f"**{bdate.strftime('%d-%m')}** - {member.mention} ({when}) {zodiac}"
+        )
+    return lines
+
+
+def build_birthday_digest_action(guild, today):
+    """The weekly digest post as a dispatcher action, or [] if the guild didn't opt in."""
+    guild_settings = settings.get(str(guild.id), {})
+    if not guild_settings.get("birthday_digest"):
+        return []
+
+    channel_name = guild_settings.get("birthday_channel", "general")
+    channel = discord.utils.get(guild.channels, name=channel_name)
+    if not channel:
+        return []
+
+    lines = format_upcoming_birthdays(
+        guild, get_upcoming_birthdays(guild.id, DIGEST_DAYS, today), today
+    )
+    if not lines:
+        return []
+
+    embed = discord.Embed(
+        title="🎂 Birthdays this week",
+        description="\n".join(lines),
+        color=discord.Color(0x000000),  # Black background
+    )
+    return [("birthday digests sent", [partial(channel.send, embed=embed)])]
 
 
 #####################################################################################################
 # Get birthday data from data channel
-@tasks.loop(hours=1)  # This task will run every hour
-async def update_birthdays(client):
+#
+# Each guild has a cursor (ID of the last data channel message processed) persisted in
+# ingest_state.json. The first run backfills the whole channel page by page; after that only
+# messages `after` the cursor are fetched, new posts are handled live from on_message, and the
+# data file is only written when a birthday actually changed.
+
+DAYS_IN_MONTH = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def parse_bdate(content):
+    """Normalize "d-m" / "dd-mm" to "dd-mm", or return None if it isn't a valid date."""
+    day, sep, month = content.strip().partition("-")
+    if not sep or not day.isdigit() or not month.isdigit():
+        return None
+    if len(day) > 2 or len(month) > 2:
+        return None
+    day, month = int(day), int(month)
+    if not 1 <= month <= 12 or not 1 <= day <= DAYS_IN_MONTH[month - 1]:
+        return None
+    return f"{day:02d}-{month:02d}"
+
+
+def _load_ingest_state():
     try:
-        # Load the current birthdays from the file (ensure it has the latest data)
-        with open(DATA_FILE, "r") as f:
-            birthdays = json.load(f)
+        with open(INGEST_STATE_FILE, "r") as f:
+            return json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
-        print("Error reading birthdays file. Initializing empty data.")
-        birthdays = {}
+        return {}
 
-    # Iterate through all guilds
-    for guild in client.guilds:
-        guild_id = str(guild.id)
-        data_channel_name = settings.get(guild_id, {}).get("data_channel")
 
-        if not data_channel_name:
-            # print(f"Guild {guild_id}: No data channel set.")
-            continue  # Skip if there's no data channel set for this guild
+def _save_ingest_state():
+    with open(INGEST_STATE_FILE, "w") as f:
+        json.dump(ingest_cursors, f, indent=4)
 
-        # Fetch the data channel (where users post their birthdays)
-        data_channel = discord.utils.get(guild.text_channels, name=data_channel_name)
 
-        if not data_channel:
-            # print(f"Guild {guild_id}: Data channel '{data_channel_name}' not found.")
-            continue  # Skip if the data channel is not found
+# guild_id (str) -> [data channel ID, ID of the last message processed (0 before any)]
+ingest_cursors = _load_ingest_state()
+# (guild_id, data channel ID) whose catch-up finished in this process; until then live posts
+# are applied but leave the cursor alone, so messages sent while the bot was down are not skipped
+_caught_up_channels = set()
 
-        # print(f"Guild {guild_id}: Reading messages from '{data_channel_name}'.")
 
-        # Initialize guild data if not present
-        if guild_id not in birthdays:
-            birthdays[guild_id] = {}
+def get_data_channel(guild):
+    data_channel_name = settings.get(str(guild.id), {}).get("data_channel")
+    if not data_channel_name:
+        return None
+    return discord.utils.get(guild.text_channels, name=data_channel_name)
 
-        # Process messages in the data channel
-        async for message in data_channel.history(limit=100):
-            # Skip if the message was sent by a bot
-            if message.author.bot:
-                continue
 
-            content = message.content.strip()
-            if not content:
-                continue  # Skip empty messages
+def ingest_message(message):
+    """Apply one data channel message to the store. Returns True if a birthday changed."""
+    if message.author.bot:
+        return False
 
-            try:
-                # Validate if the content is a valid birthday (dd-mm format)
-                bdate = datetime.strptime(content, "%d-%m").strftime("%d-%m")
-                user_id = str(message.author.id)
+    bdate = parse_bdate(message.content)
+    if bdate is None:
+        return False
 
-                # Update the birthdays data for the guild
+    changed = get_store().set_birthday(message.guild.id, message.author.id, bdate)
+    if changed:
+        print(
+            f"Added birthday for user {message.author.name} in guild {message.guild.name}: {bdate}"
+        )
+    return changed
 
-                birthdays[guild_id][user_id] = {
-                    "bdate": bdate,
-                    "xp": birthdays.get(guild_id, {}).get(user_id, {}).get("xp", 0),
-                }
-                print(
-                    f"Added birthday for user {message.author.name} in guild {guild.name}: {bdate}"
-                )
 
-            except ValueError:
-                # print(f"Invalid bdate format in message: {content}")
-                continue  # Skip invalid bdate formats
+async def ingest_data_channel(guild, data_channel):
+    """Process every message after the guild's cursor (the whole channel on first run).
+
+    Returns (birthdays changed, cursor moved).
+    """
+    guild_id = str(guild.id)
+    channel_id, cursor = ingest_cursors.get(guild_id, (None, None))
+    if channel_id != data_channel.id:
+        cursor = None  # New or changed data channel: backfill it from the start
+    after = discord.Object(id=cursor) if cursor else None
+
+    changed = False
+    last_id = cursor or 0
+    # Oldest first so a member's newest post wins; history() paginates on its own
+    async for message in data_channel.history(
+        limit=None, after=after, oldest_first=True
+    ):
+        changed |= ingest_message(message)
+        last_id = message.id
+
+    _caught_up_channels.add((guild_id, data_channel.id))
+    if cursor is None or last_id != cursor:
+        ingest_cursors[guild_id] = [data_channel.id, last_id]
+        return changed, True
+    return changed, False
 
-    # Save the updated birthdays data to the file
+
+async def handle_data_channel_message(message):
+    """Live ingestion: call from on_message for every new message."""
+    if message.guild is None:
+        return
+
+    data_channel = get_data_channel(message.guild)
+    if data_channel is None or message.channel.id != data_channel.id:
+        return
+
+    if ingest_message(message):
+        get_store().save()
+
+    # Don't jump the cursor ahead of a catch-up that hasn't finished yet: it would skip the
+    # messages posted while the bot was down (the catch-up reads this one again, harmlessly)
+    guild_id = str(message.guild.id)
+    if (guild_id, data_channel.id) not in _caught_up_channels:
+        return
+    channel_id, cursor = ingest_cursors[guild_id]
+    ingest_cursors[guild_id] = [channel_id, max(cursor, message.id)]
+    _save_ingest_state()
+
+
+async def start_birthday_ingestion():
+    """Run update_birthdays now and then every hour from the job scheduler."""
+    schedule_every(
+        "birthday_ingest", 3600, lambda client, payload: update_birthdays(client), 0
+    )
+
+
+# Catch up on anything missed (first run, downtime, edits to settings)
+async def update_birthdays(client):
+    store_changed = False
+    cursors_moved = False
+
+    # Iterate through all guilds
+    for guild in client.guilds:
+        data_channel = get_data_channel(guild)
+
+        if not data_channel:
+            # print(f"Guild {guild.id}: No data channel set or not found.")
+            continue  # Skip if there's no data channel for this guild
+
+        try:
+            changed, moved = await ingest_data_channel(guild, data_channel)
+        except discord.Forbidden:
+            continue  # Can't read the data channel
+        except discord.HTTPException as e:
+            print(f"Error reading data channel in guild {guild.name}: {e}")
+            continue
+
+        store_changed |= changed
+        cursors_moved |= moved
+
+    # Save only what changed
     try:
-        with open(DATA_FILE, "w") as f:
-            json.dump(birthdays, f, indent=4)
-        # print(f"{datetime.now().strftime('%H:%M')} - Updated birthdays file.")
+        if store_changed:
+            get_store().save()
+        if cursors_moved:
+            _save_ingest_state()
     except IOError as e:
         print(f"Error writing to birthdays file: {e}")
 
 
-def get_zodiac(day: int, month: int) -> str:
-    zodiac_signs = [
-        ("♑   Capricorn", (1, 20)),
-        ("♒   Aquarius", (2, 19)),
-        ("♓   Pisces", (3, 20)),
-        ("♈   Aries", (4, 20)),
-        ("♉   Taurus", (5, 20)),
-        ("♊   Gemini", (6, 20)),
-        ("♋   Cancer", (7, 22)),
-        ("♌   Leo", (8, 22)),
-        ("♍   Virgo", (9, 22)),
-        ("♎   Libra", (10, 22)),
-        ("♏   Scorpio", (11, 21)),
-        ("♐   Sagittarius", (12, 21)),
-        ("♑   Capricorn", (12, 31)),
-    ]
-    for sign, (m, d) in zodiac_signs:
-        if (month < m) or (month == m and day <= d):
-            return sign
+#####################################################################################################
+# Bulk birthday import (/import-birthdays)
+#
+# Rows are parsed and validated in one pass, members are resolved from the guild's member cache
+# (no API calls) and only once every row was checked are the accepted birthdays applied to the
+# store together, followed by a single save.
+
+MAX_IMPORT_BYTES = 2 * 1024 * 1024
+IMPORT_USER_KEYS = ("user", "user_id", "id", "member", "name")
+IMPORT_BDATE_KEYS = ("bdate", "birthday", "date")
+MENTION_PATTERN = re.compile(r"<@!?(\d+)>")
+
+
+def iter_import_rows(filename, text):
+    """Yield (row label, user, bdate) from a CSV or JSON import file.
+
+    CSV: `user,bdate` per line, with an optional header. JSON: {"user": "dd-mm"} or a list of
+    {"user": ..., "bdate": ...} objects. `user` is an ID, a mention or a member name.
+    """
+    if filename.lower().endswith(".json"):
+        entries = json.loads(text)
+        if isinstance(entries, dict):
+            for i, (user, bdate) in enumerate(entries.items(), start=1):
+                yield f"entry {i}", str(user), str(bdate)
+            return
+        if not isinstance(entries, list):
+            raise ValueError("JSON must be an object or a list of objects.")
+        for i, entry in enumerate(entries, start=1):
+            if not isinstance(entry, dict):
+                yield f"entry {i}", str(entry), ""
+                continue
+            user = next((entry[k] for k in IMPORT_USER_KEYS if k in entry), "")
+            bdate = next((entry[k] for k in IMPORT_BDATE_KEYS if k in entry), "")
+            yield f"entry {i}", str(user), str(bdate)
+        return
+
+    for line_number, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        # Optional header row
+        if line_number == 1 and len(row) > 1:
+            if row[1].strip().lower() in IMPORT_BDATE_KEYS:
+                continue
+        yield f"line {line_number}", row[0].strip(), (row[1] if len(row) > 1 else "")
+
+
+def _member_name_index(guild):
+    """Map lowercase user, global and display names to the member IDs using them."""
+    names = {}
+    for member in guild.members:
+        for name in {member.name, member.global_name, member.display_name}:
+            if name:
+                names.setdefault(name.lower(), set()).add(member.id)
+    return names
+
+
+def prepare_birthday_import(guild, rows):
+    """Validate import rows against the member cache.
+
+    Returns ({user_id: "dd-mm"}, [(row label, user, reason)]).
+    """
+    accepted = {}
+    rejected = []
+    names = None
+
+    for label, user, raw_bdate in rows:
+        bdate = parse_bdate(raw_bdate)
+        if bdate is None:
+            rejected.append((label, user, f"invalid date '{raw_bdate}' (use dd-mm)"))
+            continue
+
+        mention = MENTION_PATTERN.fullmatch(user)
+        user_key = mention.group(1) if mention else user
+        member_id = None
+        if user_key.isdigit():
+            if guild.get_member(int(user_key)):
+                member_id = int(user_key)
+        else:
+            if names is None:
+                names = _member_name_index(guild)
+            matches = names.get(user_key.lower(), set())
+            if len(matches) > 1:
+                rejected.append((label, user, "name matches several members"))
+                continue
+            member_id = next(iter(matches), None)
+
+        if member_id is None:
+            rejected.append((label, user, "not a member of this server"))
+        elif member_id in accepted:
+            rejected.append((label, user, "duplicate member"))
+        else:
+            accepted[member_id] = bdate
+
+    return accepted, rejected
+
+
+def apply_birthday_import(guild_id, accepted):
+    """Apply validated birthdays and save once. Returns how many changed."""
+    store = get_store()
+    changed = store.set_birthdays(guild_id, accepted)
+    if changed:
+        store.save()
+    return changed
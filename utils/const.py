@@ -4,9 +4,19 @@ import os
 
 TOKEN_FILE = "token.json"
 DATA_FILE = "data.json"
-CURRENT_TIME = datetime.now().strftime("%H:%M")
 SETTINGS_FILE = "settings.json"
 DB_CONFIG_FILE = "db_config.json"
+XP_WINDOWS_FILE = "xp_windows.json"
+INGEST_STATE_FILE = "ingest_state.json"
+JOBS_FILE = "jobs.json"
+COMPACTION_STATE_FILE = "compaction_state.json"
+ARCHIVE_FILE = "archive.json"
+SNAPSHOT_DIR = "snapshots"
+
+
+# Current wall-clock time for log lines (evaluated on every call)
+def current_time():
+    return datetime.now().strftime("%H:%M")
 
 
 # Load Token
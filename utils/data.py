@@ -4,9 +4,9 @@ from utils.const import DATA_FILE
 
 #####################################################################################################
 # Some utils
-def load_data():
+def load_data(path=DATA_FILE):
     try:
-        with open(DATA_FILE, "r") as f:
+        with open(path, "r") as f:
             return json.load(f)
     except FileNotFoundError:
         return {}  # Return empty structure if file doesn't exist
@@ -1,230 +1,661 @@
 import json
-import aiomysql
 import asyncio
+import aiomysql
 from datetime import datetime
+from itertools import islice
 import os
+import sys
+import threading
+import time
 import warnings
-from discord.ext import tasks
 
-# Import database configuration from constants
-from utils.const import DB_CONFIG
+# Connections are borrowed from the shared pool
+from utils.db import check_database_health, close_pool, db_option, get_connection
+from utils.jobs import cancel_job, schedule_every
+from utils.migrations import apply_migrations
+from utils.const import DATA_FILE, DB_CONFIG, SETTINGS_FILE, current_time
+from utils.store import get_store, UNKNOWN_BDATE
 
 
-async def get_database_connection():
-    """Create and return a database connection."""
-    if not DB_CONFIG:
-        print("Database configuration not loaded")
-        return None
+async def create_tables():
+    """Create or upgrade the database tables (see utils/migrations.py)."""
+    return await apply_migrations()
+
+
+#####################################################################################################
+# Batched upserts
+#
+# Rows are sent with executemany, which aiomysql folds into multi-row
+# INSERT ... VALUES (...), (...) ... ON DUPLICATE KEY UPDATE statements, and committed every
+# BACKUP_BATCH_SIZE rows (db_config.json "backup_batch_size"), instead of one round-trip per row
+# in a single huge transaction.
+
+BACKUP_BATCH_SIZE = int(db_option("backup_batch_size", 1000))
+
+SETTINGS_UPSERT = """
+    INSERT INTO settings (guild_id, birthday_role, birthday_channel, data_channel, announcement_channel, level)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    birthday_role = VALUES(birthday_role),
+    birthday_channel = VALUES(birthday_channel),
+    data_channel = VALUES(data_channel),
+    announcement_channel = VALUES(announcement_channel),
+    level = VALUES(level)
+"""
+
+USER_DATA_UPSERT = """
+    INSERT INTO {table} (guild_id, user_id, bdate, xp)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    bdate = VALUES(bdate),
+    xp = VALUES(xp)
+"""
+
+
+async def upsert_in_batches(connection, cursor, query, rows, batch_size=None):
+    """executemany `query` over `rows` (any iterable), committing after each batch.
+
+    Returns the number of rows sent.
+    """
+    batch_size = max(1, int(batch_size or BACKUP_BATCH_SIZE))
+    rows = iter(rows)
+    sent = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return sent
+        await cursor.executemany(query, batch)
+        await connection.commit()
+        sent += len(batch)
+
+
+def _settings_rows(settings_data):
+    for guild_id, settings in settings_data.items():
+        yield (
+            guild_id,
+            settings.get("birthday_role"),
+            settings.get("birthday_channel"),
+            settings.get("data_channel"),
+            settings.get("announcement_channel"),
+            settings.get("level", False),
+        )
 
-    try:
-        connection = await aiomysql.connect(**DB_CONFIG)
-        return connection
-    except Exception as e:
-        print(f"Database connection error: {e}")
-        return None
 
+def _user_data_rows(guilds):
+    for guild_id, users in guilds.items():
+        for user_id, user_info in users.items():
+            yield (
+                guild_id,
+                user_id,
+                user_info.get("bdate", "Unknown"),
+                user_info.get("xp", 0),
+            )
 
-async def create_tables():
-    """Create necessary database tables if they don't exist."""
-    connection = await get_database_connection()
-    if not connection:
-        return False
 
-    try:
-        cursor = await connection.cursor()
+async def _fetch_keys(cursor, query):
+    """Return the primary keys of a table as a set of string tuples."""
+    await cursor.execute(query)
+    return {tuple(str(value) for value in row) for row in await cursor.fetchall()}
 
-        # Check if tables exist first to avoid warnings
-        await cursor.execute("SHOW TABLES LIKE 'settings'")
-        settings_exists = await cursor.fetchone()
 
-        await cursor.execute("SHOW TABLES LIKE 'user_data'")
-        user_data_exists = await cursor.fetchone()
+async def delete_settings_rows(connection, cursor, guild_ids, batch_size=None):
+    batch_size = max(1, int(batch_size or BACKUP_BATCH_SIZE))
+    guild_ids = list(guild_ids)
+    for start in range(0, len(guild_ids), batch_size):
+        chunk = guild_ids[start : start + batch_size]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        await cursor.execute(
+            f"DELETE FROM settings WHERE guild_id IN ({placeholders})", chunk
+        )
+        await connection.commit()
 
-        # Only create tables if they don't exist
-        if not settings_exists:
-            await cursor.execute(
-                """
-            CREATE TABLE settings (
-                guild_id VARCHAR(50) PRIMARY KEY,
-                birthday_role VARCHAR(100),
-                birthday_channel VARCHAR(100),
-                data_channel VARCHAR(100),
-                announcement_channel VARCHAR(100),
-                level BOOLEAN
-            )
-            """
-            )
-            print("Settings table created.")
 
-        if not user_data_exists:
+async def delete_user_rows(connection, cursor, keys, batch_size=None):
+    """Delete (guild_id, user_id) rows, one statement per guild and batch."""
+    batch_size = max(1, int(batch_size or BACKUP_BATCH_SIZE))
+    by_guild = {}
+    for guild_id, user_id in keys:
+        by_guild.setdefault(guild_id, []).append(user_id)
+
+    for guild_id, user_ids in by_guild.items():
+        for start in range(0, len(user_ids), batch_size):
+            chunk = user_ids[start : start + batch_size]
+            placeholders = ", ".join(["%s"] * len(chunk))
             await cursor.execute(
-                """
-            CREATE TABLE user_data (
-                guild_id VARCHAR(50),
-                user_id VARCHAR(50),
-                bdate VARCHAR(10),
-                xp INT,
-                PRIMARY KEY (guild_id, user_id)
-            )
-            """
+                f"DELETE FROM user_data WHERE guild_id = %s AND user_id IN ({placeholders})",
+                (guild_id, *chunk),
             )
-            print("User data table created.")
+            await connection.commit()
 
-        await connection.commit()
-        if settings_exists and user_data_exists:
-            print("Database tables already exist.")
-        else:
-            print("Database tables created successfully.")
-        return True
 
-    except Exception as e:
-        print(f"Error creating tables: {e}")
-        return False
-    finally:
-        await cursor.close()
-        connection.close()
+#####################################################################################################
+# Streaming rows out of a store snapshot
+#
+# Building every row of a large store on the event loop blocks it and holds all rows in memory
+# at once. A worker thread walks a snapshot guild by guild and hands fixed-size batches to the
+# event loop through a bounded queue: when the database writer falls behind, the thread waits,
+# so at most BACKUP_QUEUE_SIZE batches exist at any time. Snapshot maps are never written (the
+# store copies a guild before changing it), so the thread can read them without locking.
 
+BACKUP_QUEUE_SIZE = 4
 
-async def backup_settings_to_database():
-    """Backup settings.json data to the database."""
-    connection = await get_database_connection()
-    if not connection:
-        return False
+
+def _produce_user_batches(guilds, batch_size, loop, queue, stop):
+    """Worker thread: put row batches on `queue`, then None. Stops early once `stop` is set."""
+
+    def put(item):
+        # Blocks this thread (not the event loop) while the queue is full
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
 
     try:
-        cursor = await connection.cursor()
+        batch = []
+        for row in _user_data_rows(guilds):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                if stop.is_set():
+                    return
+                put(batch)
+                batch = []
+        if batch and not stop.is_set():
+            put(batch)
+    finally:
+        if not stop.is_set():
+            put(None)
 
-        # Check if settings.json exists
-        if not os.path.exists("settings.json"):
-            print("settings.json not found, skipping settings backup.")
-            return True
 
-        # Read and insert settings.json
-        with open("settings.json", "r") as file:
-            settings_data = json.load(file)
-            for guild_id, settings in settings_data.items():
-                await cursor.execute(
-                    """
-                INSERT INTO settings (guild_id, birthday_role, birthday_channel, data_channel, announcement_channel, level)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                birthday_role = VALUES(birthday_role),
-                birthday_channel = VALUES(birthday_channel),
-                data_channel = VALUES(data_channel),
-                announcement_channel = VALUES(announcement_channel),
-                level = VALUES(level)
-                """,
-                    (
-                        guild_id,
-                        settings.get("birthday_role"),
-                        settings.get("birthday_channel"),
-                        settings.get("data_channel"),
-                        settings.get("announcement_channel"),
-                        settings.get("level", False),
-                    ),
-                )
+async def stream_user_batches(guilds, batch_size=None):
+    """Async iterator over batches of user_data rows built from a snapshot by a worker thread."""
+    batch_size = max(1, int(batch_size or BACKUP_BATCH_SIZE))
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=BACKUP_QUEUE_SIZE)
+    stop = threading.Event()
+    producer = asyncio.ensure_future(
+        asyncio.to_thread(_produce_user_batches, guilds, batch_size, loop, queue, stop)
+    )
 
-        await connection.commit()
-        print(
-            f"Settings backup completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        )
+    try:
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                break
+            yield batch
+        await producer  # Re-raise anything the worker failed with
+    finally:
+        if not producer.done():
+            # Consumer gave up early: unblock the worker and wait for it to exit
+            stop.set()
+            while not producer.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.sleep(0.01)
+
+
+#####################################################################################################
+# Incremental backups
+#
+# Most runs only send what changed since the previous successful run:
+#   - user data comes from the data store's change feed (written keys plus tombstones for
+#     deleted records); a failed run puts its batch back into the feed.
+#   - settings.json is small, so it is diffed against the rows last written.
+# A full sweep (every row upserted, rows that no longer exist deleted) runs on the first backup
+# after startup and every FULL_SWEEP_INTERVAL, covering anything the feed could have missed
+# (e.g. changes made while the bot was down). With runs this cheap the backup interval is
+# minutes instead of a day.
+#
+# The database may be the only copy left when data.json is lost, so sweeps delete stale rows
+# defensively: never on the first sweep after startup, never from an empty or badly loaded
+# source, and never more than STALE_DELETE_FRACTION of the table in one sweep.
+
+BACKUP_INTERVAL = 5 * 60
+FULL_SWEEP_INTERVAL = 24 * 60 * 60
+STALE_DELETE_FRACTION = 0.1
+# Small tables (e.g. a handful of guild settings) may always lose this many rows
+STALE_DELETE_MIN = 10
+
+# Settings rows as last written to the database ({guild_id: row}); None until a full sweep
+_backed_up_settings = None
+_last_full_sweep = 0.0
+
+
+def _stale_delete_allowed(table, stale_count, existing_count):
+    """True if deleting `stale_count` of `existing_count` rows is within the sweep's cap."""
+    limit = max(STALE_DELETE_MIN, int(existing_count * STALE_DELETE_FRACTION))
+    if stale_count <= limit:
         return True
+    print(
+        f"Not deleting {stale_count} of {existing_count} {table} rows (limit {limit} per "
+        "sweep); check the local data and restore from the backup if it was lost."
+    )
+    return False
 
-    except Exception as e:
-        print(f"Error backing up settings: {e}")
-        return False
-    except Exception as e:
-        print(f"General error during settings backup: {e}")
-        return False
-    finally:
-        await cursor.close()
-        connection.close()
 
+def _load_settings_rows():
+    with open("settings.json", "r") as file:
+        return {row[0]: row for row in _settings_rows(json.load(file))}
 
-async def backup_user_data_to_database():
-    """Backup data.json user data to the database."""
-    connection = await get_database_connection()
-    if not connection:
-        return False
 
-    try:
-        cursor = await connection.cursor()
+async def backup_settings_to_database(batch_size=None, full=True, delete_stale=True):
+    """Backup settings.json data to the database (only changed guilds unless `full`).
+
+    Without `delete_stale`, rows of guilds missing from settings.json are kept.
+    """
+    global _backed_up_settings
+
+    # Check if settings.json exists
+    if not os.path.exists("settings.json"):
+        print("settings.json not found, skipping settings backup.")
+        return True
+
+    async with get_connection() as connection:
+        if not connection:
+            return False
+
+        try:
+            rows = _load_settings_rows()
+            full = full or _backed_up_settings is None
+
+            async with connection.cursor() as cursor:
+                if full:
+                    upserts = list(rows.values())
+                    existing = await _fetch_keys(cursor, "SELECT guild_id FROM settings")
+                    removed = {guild_id for (guild_id,) in existing} - set(rows)
+                else:
+                    existing = _backed_up_settings
+                    upserts = [
+                        row
+                        for guild_id, row in rows.items()
+                        if _backed_up_settings.get(guild_id) != row
+                    ]
+                    removed = set(_backed_up_settings) - set(rows)
+
+                # An empty settings.json is far more likely a lost file than every guild gone
+                if removed and (
+                    not delete_stale
+                    or not rows
+                    or not _stale_delete_allowed("settings", len(removed), len(existing))
+                ):
+                    removed = set()
+
+                count = await upsert_in_batches(
+                    connection, cursor, SETTINGS_UPSERT, upserts, batch_size
+                )
+                await delete_settings_rows(connection, cursor, removed, batch_size)
 
-        # Check if data.json exists
-        if not os.path.exists("data.json"):
-            print("data.json not found, skipping user data backup.")
+            _backed_up_settings = rows
+            if full or count or removed:
+                print(
+                    f"Settings backup completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} "
+                    f"({count} upserted, {len(removed)} deleted)"
+                )
             return True
 
-        # Read and insert data.json
-        with open("data.json", "r") as file:
-            data_data = json.load(file)
-            for guild_id, users in data_data.items():
-                for user_id, user_info in users.items():
-                    await cursor.execute(
-                        """
-                    INSERT INTO user_data (guild_id, user_id, bdate, xp)
-                    VALUES (%s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                    bdate = VALUES(bdate),
-                    xp = VALUES(xp)
-                    """,
-                        (
-                            guild_id,
-                            user_id,
-                            user_info.get("bdate", "Unknown"),
-                            user_info.get("xp", 0),
-                        ),
+        except Exception as e:
+            print(f"Error backing up settings: {e}")
+            return False
+
+
+async def backup_user_data_to_database(batch_size=None, delete_stale=True):
+    """Full sweep: write every record of the data store and delete rows that no longer exist.
+
+    The sweep reads a copy-on-write snapshot of the store, so it sees one consistent point in
+    time while live writes carry on. Rows are streamed from it in batches (see
+    stream_user_batches) and stale database keys are found with an unbuffered cursor, so memory
+    stays flat however large the data is. Stale rows are only deleted with `delete_stale`, from
+    a store that loaded cleanly and is not empty, and within the sweep's deletion cap.
+    """
+    store = get_store()
+
+    async with get_connection() as connection:
+        if not connection:
+            return False
+
+        # Writes after this point reach the change feed and the next incremental run
+        store.drain_changes()
+        with store.snapshot() as guilds:
+            try:
+                count = 0
+                async with connection.cursor() as cursor:
+                    async for batch in stream_user_batches(guilds, batch_size):
+                        await cursor.executemany(
+                            USER_DATA_UPSERT.format(table="user_data"), batch
+                        )
+                        await connection.commit()
+                        count += len(batch)
+
+                removed = []
+                if delete_stale and (not store.loaded_cleanly or not guilds):
+                    print("Data store empty or not loaded cleanly, keeping stale backup rows.")
+                elif delete_stale:
+                    removed, existing = await _find_stale_user_keys(
+                        connection, guilds, batch_size
                     )
+                    if not _stale_delete_allowed("user_data", len(removed), existing):
+                        removed = []
+                async with connection.cursor() as cursor:
+                    await delete_user_rows(connection, cursor, removed, batch_size)
+
+                print(
+                    f"User data backup completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} "
+                    f"({count} rows, {len(removed)} deleted)"
+                )
+                return True
+
+            except Exception as e:
+                print(f"Error backing up user data: {e}")
+                return False
+
+
+async def _find_stale_user_keys(connection, guilds, batch_size=None):
+    """Stream the database's user_data keys. Returns (keys missing from `guilds`, row count)."""
+    batch_size = max(1, int(batch_size or BACKUP_BATCH_SIZE))
+    stale = []
+    existing = 0
+    # Unbuffered: rows arrive batch by batch instead of the whole table at once
+    async with connection.cursor(aiomysql.SSCursor) as cursor:
+        await cursor.execute("SELECT guild_id, user_id FROM user_data")
+        while True:
+            rows = await cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            existing += len(rows)
+            stale.extend(
+                (str(guild_id), str(user_id))
+                for guild_id, user_id in rows
+                if str(user_id) not in guilds.get(str(guild_id), {})
+            )
+    return stale, existing
 
-        await connection.commit()
-        print(
-            f"User data backup completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        )
+
+async def backup_user_data_changes(batch_size=None):
+    """Send only the records written or deleted since the last successful backup."""
+    store = get_store()
+    changed, deleted = store.drain_changes()
+    if not changed and not deleted:
         return True
 
-    except Exception as e:
-        print(f"Error backing up user data: {e}")
-        return False
-    except Exception as e:
-        print(f"General error during user data backup: {e}")
-        return False
-    finally:
-        await cursor.close()
-        connection.close()
+    async with get_connection() as connection:
+        if not connection:
+            store.requeue_changes(changed, deleted)
+            return False
+
+        try:
+            async with connection.cursor() as cursor:
+                await upsert_in_batches(
+                    connection,
+                    cursor,
+                    USER_DATA_UPSERT.format(table="user_data"),
+                    _user_data_rows(_group_by_guild(changed)),
+                    batch_size,
+                )
+                await delete_user_rows(connection, cursor, deleted, batch_size)
+
+            print(
+                f"User data changes backed up at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} "
+                f"({len(changed)} upserted, {len(deleted)} deleted)"
+            )
+            return True
+
+        except Exception as e:
+            print(f"Error backing up user data changes: {e}")
+            store.requeue_changes(changed, deleted)
+            return False
+
 
+def _group_by_guild(records):
+    """{(guild_id, user_id): record} -> {guild_id: {user_id: record}}"""
+    guilds = {}
+    for (guild_id, user_id), record in records.items():
+        guilds.setdefault(guild_id, {})[user_id] = record
+    return guilds
 
-async def backup_all_data():
-    """Backup both settings and user data to the database."""
-    print(f"Starting daily backup at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
-    # Create tables if they don't exist
-    await create_tables()
+async def backup_all_data(full=True, delete_stale=True):
+    """Backup settings and user data to the database: a full sweep, or only the changes.
 
-    # Backup settings and user data
-    settings_success = await backup_settings_to_database()
-    user_data_success = await backup_user_data_to_database()
+    Without `delete_stale` a full sweep only upserts (see backup_task).
+    """
+    global _last_full_sweep
+
+    if full:
+        print(f"Starting full backup at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        # Bring the schema up to date; never write into a half-migrated one
+        if not await create_tables():
+            print(f"{current_time()} - Database migrations failed, skipping this backup run.")
+            return False
+        user_data_success = await backup_user_data_to_database(delete_stale=delete_stale)
+    else:
+        user_data_success = await backup_user_data_changes()
+    settings_success = await backup_settings_to_database(
+        full=full, delete_stale=delete_stale
+    )
 
     if settings_success and user_data_success:
-        print("Daily backup completed successfully.")
+        if full:
+            _last_full_sweep = time.time()
+            print("Full backup completed successfully.")
         return True
     else:
-        print("Daily backup completed with some errors.")
+        print("Backup completed with some errors.")
+        return False
+
+
+async def backup_task(client=None, payload=None):
+    """Backup job: the changes since the last run, or a full sweep when one is due."""
+    # Nothing is drained while the database is down: changes stay in the feed for the next run
+    if not await check_database_health():
+        print(f"{current_time()} - Database unavailable, skipping this backup run.")
+        return
+    # The first sweep after startup only upserts: stale rows are deleted by later sweeps, once
+    # the store has been running on data that loaded cleanly
+    first_sweep = _last_full_sweep == 0
+    await backup_all_data(
+        full=time.time() - _last_full_sweep >= FULL_SWEEP_INTERVAL,
+        delete_stale=not first_sweep,
+    )
+
+
+# Job ID of the former once-a-day backup, removed from jobs.json on startup
+DAILY_BACKUP_JOB = "backup:daily"
+
+
+async def start_backups():
+    """Run the backup job every BACKUP_INTERVAL (a full sweep first)."""
+    cancel_job(DAILY_BACKUP_JOB)
+    if not DB_CONFIG:
+        print("Database not configured, backups disabled.")
+        return
+    schedule_every("backup", BACKUP_INTERVAL, backup_task, time.time())
+    print("Backup task started.")
+
+
+#####################################################################################################
+# Restore: python -m utils.data_backup restore [--force]
+#
+# Rebuilds data.json and settings.json from the backup tables. Both tables are streamed with an
+# unbuffered SSCursor in BACKUP_BATCH_SIZE batches into plain dicts, then handed to the store in
+# one go, so the rank and birthday indexes are rebuilt once instead of per row. Settings rows are
+# merged into settings.json, keeping keys the database does not store (timezone, XP rules, ...).
+#
+# With "restore_on_start": true in db_config.json, the bot restores on startup when data.json
+# is missing.
+
+SETTINGS_COLUMNS = (
+    "birthday_role",
+    "birthday_channel",
+    "data_channel",
+    "announcement_channel",
+    "level",
+)
+
+
+async def _stream_rows(connection, query, batch_size):
+    """Yield the rows of `query` in batches from an unbuffered cursor."""
+    async with connection.cursor(aiomysql.SSCursor) as cursor:
+        await cursor.execute(query)
+        while True:
+            rows = await cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+
+
+async def restore_from_database(batch_size=None):
+    """Restore the data store and settings.json from the database. Returns True on success."""
+    batch_size = max(1, int(batch_size or BACKUP_BATCH_SIZE))
+
+    async with get_connection() as connection:
+        if not connection:
+            return False
+
+        try:
+            guilds = {}
+            user_count = 0
+            async for rows in _stream_rows(
+                connection,
+                "SELECT guild_id, user_id, bdate, xp FROM user_data",
+                batch_size,
+            ):
+                for guild_id, user_id, bdate, xp in rows:
+                    guilds.setdefault(str(guild_id), {})[str(user_id)] = {
+                        "bdate": bdate or UNKNOWN_BDATE,
+                        "xp": int(xp or 0),
+                    }
+                user_count += len(rows)
+
+            restored_settings = {}
+            async for rows in _stream_rows(
+                connection,
+                f"SELECT guild_id, {', '.join(SETTINGS_COLUMNS)} FROM settings",
+                batch_size,
+            ):
+                for guild_id, *values in rows:
+                    guild_settings = dict(zip(SETTINGS_COLUMNS, values))
+                    guild_settings["level"] = bool(guild_settings["level"])
+                    restored_settings[str(guild_id)] = {
+                        key: value
+                        for key, value in guild_settings.items()
+                        if value is not None
+                    }
+
+        except Exception as e:
+            print(f"Error restoring from the database: {e}")
+            return False
+
+    try:
+        get_store().restore(guilds)
+        _merge_settings(restored_settings)
+    except IOError as e:
+        print(f"Error writing restored data: {e}")
         return False
 
+    print(
+        f"Restore completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} "
+        f"({user_count} users in {len(guilds)} guilds, {len(restored_settings)} guild settings)"
+    )
+    return True
+
+
+def _merge_settings(restored_settings):
+    settings_data = {}
+    if os.path.exists(SETTINGS_FILE):
+        with open(SETTINGS_FILE, "r") as file:
+            settings_data = json.load(file)
+
+    for guild_id, guild_settings in restored_settings.items():
+        settings_data.setdefault(guild_id, {}).update(guild_settings)
+
+    tmp_path = f"{SETTINGS_FILE}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(settings_data, file, indent=4)
+    os.replace(tmp_path, SETTINGS_FILE)
+
+
+async def run_restore(batch_size=None):
+    try:
+        return await restore_from_database(batch_size)
+    finally:
+        await close_pool()
+
+
+def restore_on_start():
+    """Startup mode: restore from the database if data.json is missing and it is enabled.
+
+    Call before anything loads data or settings (it runs its own event loop).
+    """
+    if db_option("restore_on_start", False) and not os.path.exists(DATA_FILE):
+        print(f"{DATA_FILE} not found, restoring from the database...")
+        asyncio.run(run_restore())
+
+
+#####################################################################################################
+# Benchmark: python -m utils.data_backup benchmark [rows] [batch_size]
+#
+# Upserts synthetic rows into a scratch copy of user_data (inserts, then the same keys again as
+# updates) and reports rows per second, e.g. against a local MySQL/MariaDB container.
+
 
-@tasks.loop(hours=24)
-async def daily_backup_task():
-    """Task that runs daily to backup data to the database."""
-    await backup_all_data()
+async def benchmark_user_data_upsert(rows=100_000, batch_size=None):
+    batch_size = batch_size or BACKUP_BATCH_SIZE
+    table = "user_data_benchmark"
 
+    async with get_connection() as connection:
+        if not connection:
+            return None
 
-async def start_daily_backup():
-    """Start the daily backup task."""
-    if not daily_backup_task.is_running():
-        daily_backup_task.start()
-        print("Daily backup task started.")
+        async with connection.cursor() as cursor:
+            await cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            await cursor.execute(f"CREATE TABLE {table} LIKE user_data")
+            try:
+                results = {}
+                for phase, xp in (("insert", 0), ("update", 1)):
+                    synthetic = (
+                        (str(i % 100), str(i), "Unknown", xp) for i in range(rows)
+                    )
+                    started = time.perf_counter()
+                    await upsert_in_batches(
+                        connection,
+                        cursor,
+                        USER_DATA_UPSERT.format(table=table),
+                        synthetic,
+                        batch_size,
+                    )
+                    elapsed = time.perf_counter() - started
+                    results[phase] = rows / elapsed if elapsed else float("inf")
+                    print(
+                        f"{phase:<7} {rows} rows in {elapsed:.2f}s "
+                        f"({results[phase]:,.0f} rows/s, batch size {batch_size})"
+                    )
+                return results
+            finally:
+                await cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+async def run_backup_once():
+    """Back up everything once and close the database pool."""
+    try:
+        await backup_all_data()
+    finally:
+        await close_pool()
+
+
+async def run_benchmark(rows, batch_size):
+    try:
+        await create_tables()
+        await benchmark_user_data_upsert(rows, batch_size)
+    finally:
+        await close_pool()
 
 
 # For backwards compatibility - run backup if script is executed directly
 if __name__ == "__main__":
-    asyncio.run(backup_all_data())
+    if len(sys.argv) > 1 and sys.argv[1] == "restore":
+        if os.path.exists(DATA_FILE) and "--force" not in sys.argv:
+            print(f"{DATA_FILE} exists; use --force to overwrite it with the backup.")
+            sys.exit(1)
+        sys.exit(0 if asyncio.run(run_restore()) else 1)
+    elif len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        rows = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+        batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        asyncio.run(run_benchmark(rows, batch_size))
+    else:
+        asyncio.run(run_backup_once())
@@ -0,0 +1,123 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiomysql
+
+from utils.const import DB_CONFIG
+
+#####################################################################################################
+# Database connection pool
+#
+# Every database operation used to open (and close) its own connection, so one backup run paid
+# for three TCP + auth handshakes. One pool per process is now shared by the backups, the
+# fetch_data CLI and any other reader. Pool sizing lives next to the connection settings in
+# db_config.json:
+#
+#   "pool_minsize": 1, "pool_maxsize": 5, "pool_recycle": 3600
+#
+# Connections are pinged (and reconnected if needed) when borrowed, and recycled after
+# pool_recycle seconds so MySQL's wait_timeout never hands out a dead connection.
+
+DEFAULT_POOL_MINSIZE = 1
+DEFAULT_POOL_MAXSIZE = 5
+DEFAULT_POOL_RECYCLE = 3600
+
+# Keys in db_config.json that configure the bot rather than the connection
+OPTION_KEYS = (
+    "pool_minsize",
+    "pool_maxsize",
+    "pool_recycle",
+    "backup_batch_size",
+    "restore_on_start",
+)
+
+_pool = None
+_pool_lock = None
+
+
+def db_option(name, default):
+    """Read a bot option (see OPTION_KEYS) from db_config.json."""
+    return (DB_CONFIG or {}).get(name, default)
+
+
+def _pool_options(config):
+    """Split db_config.json into pool settings and connection arguments."""
+    connect_args = {k: v for k, v in config.items() if k not in OPTION_KEYS}
+    minsize = int(config.get("pool_minsize", DEFAULT_POOL_MINSIZE))
+    maxsize = int(config.get("pool_maxsize", DEFAULT_POOL_MAXSIZE))
+    recycle = int(config.get("pool_recycle", DEFAULT_POOL_RECYCLE))
+    return {
+        "minsize": max(0, minsize),
+        "maxsize": max(1, minsize, maxsize),
+        "pool_recycle": recycle,
+        **connect_args,
+    }
+
+
+async def get_pool():
+    """Return the process-wide pool, creating it on first use (None if unavailable)."""
+    global _pool, _pool_lock
+    if not DB_CONFIG:
+        print("Database configuration not loaded")
+        return None
+
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+
+    async with _pool_lock:
+        if _pool is None or _pool.closed:
+            try:
+                _pool = await aiomysql.create_pool(**_pool_options(DB_CONFIG))
+            except Exception as e:
+                print(f"Database connection error: {e}")
+                _pool = None
+    return _pool
+
+
+@asynccontextmanager
+async def get_connection():
+    """Borrow a healthy connection from the pool; yields None if the database is unavailable.
+
+    async with get_connection() as connection:
+        if not connection:
+            return ...
+    """
+    pool = await get_pool()
+    if pool is None:
+        yield None
+        return
+
+    async with pool.acquire() as connection:
+        try:
+            # Health check: revive connections dropped by the server while idle
+            await connection.ping(reconnect=True)
+        except Exception as e:
+            print(f"Database connection error: {e}")
+            # Do not put a broken connection back into the pool
+            connection.close()
+            yield None
+            return
+        yield connection
+
+
+async def check_database_health():
+    """Return True if the database answers a trivial query."""
+    async with get_connection() as connection:
+        if not connection:
+            return False
+        try:
+            async with connection.cursor() as cursor:
+                await cursor.execute("SELECT 1")
+                return (await cursor.fetchone()) == (1,)
+        except Exception as e:
+            print(f"Database health check failed: {e}")
+            return False
+
+
+async def close_pool():
+    """Close the pool, waiting for borrowed connections to be returned."""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
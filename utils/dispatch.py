@@ -0,0 +1,84 @@
+import asyncio
+
+import discord
+
+from utils.ratelimit import call_with_backoff
+
+#####################################################################################################
+# Bulk action dispatch
+#
+# Runs a batch of Discord REST actions for one guild with a small concurrency cap (role edits and
+# messages share per-guild rate limit buckets) while separate guilds run side by side, so one slow
+# or rate-limited guild no longer delays everyone queued after it. Every call goes through
+# call_with_backoff and the outcome of each action is counted for the end-of-run summary.
+
+GUILD_CONCURRENCY = 2
+
+
+class DispatchSummary:
+    def __init__(self):
+        self.succeeded = {}  # action kind -> count
+        self.failed = {}  # action kind -> count
+
+    def record(self, kind, ok):
+        counts = self.succeeded if ok else self.failed
+        counts[kind] = counts.get(kind, 0) + 1
+
+    def merge(self, other):
+        for kind, count in other.succeeded.items():
+            self.succeeded[kind] = self.succeeded.get(kind, 0) + count
+        for kind, count in other.failed.items():
+            self.failed[kind] = self.failed.get(kind, 0) + count
+        return self
+
+    def __str__(self):
+        if not self.succeeded and not self.failed:
+            return "nothing to do"
+        parts = [f"{count} {kind}" for kind, count in sorted(self.succeeded.items())]
+        parts += [
+            f"{count} {kind} failed" for kind, count in sorted(self.failed.items())
+        ]
+        return ", ".join(parts)
+
+
+async def dispatch_guild_actions(guild, actions, concurrency=GUILD_CONCURRENCY):
+    """Run [(kind, steps)] for one guild, where steps is a list of coroutine factories.
+
+    The steps of one action run in order and stop at the first failure (e.g. no announcement if
+    the role could not be given). Returns a DispatchSummary.
+    """
+    summary = DispatchSummary()
+    semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+
+    async def _run(kind, steps):
+        async with semaphore:
+            for step in steps:
+                try:
+                    await call_with_backoff(step)
+                except discord.Forbidden:
+                    print(f"Missing permissions for {kind} in guild {guild.name}.")
+                    summary.record(kind, False)
+                    return
+                except (discord.HTTPException, discord.RateLimited, OSError) as e:
+                    print(f"Giving up on {kind} in guild {guild.name}: {e}")
+                    summary.record(kind, False)
+                    return
+            summary.record(kind, True)
+
+    await asyncio.gather(*(_run(kind, steps) for kind, steps in actions))
+    return summary
+
+
+async def dispatch_all(guild_actions, concurrency=GUILD_CONCURRENCY):
+    """Run {guild: actions} for every guild concurrently and return the merged summary."""
+    summaries = await asyncio.gather(
+        *(
+            dispatch_guild_actions(guild, actions, concurrency)
+            for guild, actions in guild_actions.items()
+            if actions
+        )
+    )
+    total = DispatchSummary()
+    for summary in summaries:
+        total.merge(summary)
+    return total
@@ -0,0 +1,219 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+import uuid
+
+from utils.const import JOBS_FILE
+
+#####################################################################################################
+# Job scheduler
+#
+# One timer loop runs every delayed or periodic action of the bot:
+#   - durable jobs (schedule_job) are kept in jobs.json, so a pending action such as removing a
+#     test birthday role or the next daily backup survives a restart. A job that was due while
+#     the bot was offline runs as soon as the scheduler starts.
+#   - interval jobs (schedule_every) are in-memory and re-registered by their module on startup;
+#     the next run is scheduled when the previous one finishes, so runs never overlap.
+#
+# Handlers are registered per job kind and called as `await handler(client, payload)`. A durable
+# job that still fails after MAX_ATTEMPTS is dropped; its kind can register an
+# `on_give_up(payload)` callback to schedule the next occurrence.
+
+RETRY_DELAY = 60
+MAX_ATTEMPTS = 3
+
+
+class JobScheduler:
+    def __init__(self, path=JOBS_FILE):
+        self.path = path
+        self.jobs = {}  # job_id -> {"kind", "run_at", "payload", "attempts"} (persisted)
+        self.intervals = {}  # job_id -> {"kind", "run_at", "seconds"} (in-memory)
+        self.handlers = {}  # kind -> coroutine function (client, payload)
+        self.give_up_handlers = {}  # kind -> function (payload), after the last attempt
+        self._heap = []  # (run_at, tie breaker, job_id); stale entries are skipped
+        self._counter = itertools.count()
+        self._wake = asyncio.Event()
+        self._running = False
+        self._load()
+
+    #################################################################################################
+    # Persistence
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                self.jobs = json.load(f)
+        except FileNotFoundError:
+            self.jobs = {}
+        except json.JSONDecodeError as e:
+            print(f"Error reading jobs file, starting with no jobs: {e}")
+            self.jobs = {}
+
+        for job_id, job in self.jobs.items():
+            self._push(job["run_at"], job_id)
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.jobs, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    #################################################################################################
+    # Scheduling
+
+    def _push(self, run_at, job_id):
+        heapq.heappush(self._heap, (run_at, next(self._counter), job_id))
+        self._wake.set()
+
+    def register(self, kind, handler, on_give_up=None):
+        self.handlers[kind] = handler
+        if on_give_up is not None:
+            self.give_up_handlers[kind] = on_give_up
+
+    def schedule(self, kind, run_at, payload=None, job_id=None):
+        """Persist a one-off job; an existing job with the same ID is replaced."""
+        job_id = job_id or uuid.uuid4().hex
+        self.jobs[job_id] = {
+            "kind": kind,
+            "run_at": run_at,
+            "payload": payload or {},
+            "attempts": 0,
+        }
+        self._save()
+        self._push(run_at, job_id)
+        return job_id
+
+    def cancel(self, job_id):
+        if self.jobs.pop(job_id, None) is not None:
+            self._save()
+            return True
+        return self.intervals.pop(job_id, None) is not None
+
+    def every(self, kind, seconds, first_run=None):
+        """Run `kind` every `seconds` (not persisted). Returns the interval job ID.
+
+        Scheduling a kind that is already scheduled (e.g. from on_ready after a reconnect) only
+        updates its period; the next run keeps its time.
+        """
+        job_id = f"every:{kind}"
+        existing = self.intervals.get(job_id)
+        if existing is not None:
+            existing["seconds"] = seconds
+            return job_id
+        run_at = time.time() + seconds if first_run is None else first_run
+        self.intervals[job_id] = {"kind": kind, "run_at": run_at, "seconds": seconds}
+        self._push(run_at, job_id)
+        return job_id
+
+    def _current(self, job_id):
+        return self.jobs.get(job_id) or self.intervals.get(job_id)
+
+    #################################################################################################
+    # Running
+
+    async def run(self, client):
+        """The single timer loop. Sleeps until the earliest job and starts every due one."""
+        # on_ready can fire again after a reconnect; only one loop may run
+        if self._running:
+            return
+        self._running = True
+
+        while True:
+            self._wake.clear()
+
+            if not self._heap:
+                await self._wake.wait()
+                continue
+
+            run_at, _, job_id = self._heap[0]
+            job = self._current(job_id)
+            if job is None or job["run_at"] != run_at:
+                heapq.heappop(self._heap)  # Cancelled or rescheduled
+                continue
+
+            delay = run_at - time.time()
+            if delay > 0:
+                # Wake early if something is scheduled before the current earliest job
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            asyncio.create_task(self._execute(client, job_id, job))
+
+    async def _execute(self, client, job_id, job):
+        handler = self.handlers.get(job["kind"])
+        interval = job_id in self.intervals
+
+        if handler is None:
+            print(f"No handler registered for job '{job['kind']}', retrying later.")
+            ok = False
+        else:
+            try:
+                await handler(client, job.get("payload", {}))
+                ok = True
+            except Exception as e:
+                print(f"Job '{job['kind']}' failed: {e}")
+                ok = False
+
+        if interval:
+            # Next run counts from the end of this one, so runs never overlap
+            if self.intervals.get(job_id) is job:
+                job["run_at"] = time.time() + job["seconds"]
+                self._push(job["run_at"], job_id)
+            return
+
+        # The handler may have rescheduled its own job ID; only settle the run we executed
+        if self.jobs.get(job_id) is not job:
+            return
+        if ok or job["attempts"] + 1 >= MAX_ATTEMPTS:
+            del self.jobs[job_id]
+            self._save()
+            on_give_up = self.give_up_handlers.get(job["kind"])
+            if not ok and on_give_up is not None:
+                print(f"Job '{job['kind']}' failed {MAX_ATTEMPTS} times, giving up.")
+                on_give_up(job.get("payload", {}))
+            return
+
+        job["attempts"] += 1
+        job["run_at"] = time.time() + RETRY_DELAY
+        self._push(job["run_at"], job_id)
+        self._save()
+
+
+scheduler = JobScheduler()
+
+
+def register_job_handler(kind, handler, on_give_up=None):
+    scheduler.register(kind, handler, on_give_up)
+
+
+def schedule_job(kind, run_at, payload=None, job_id=None):
+    return scheduler.schedule(kind, run_at, payload, job_id)
+
+
+def schedule_job_in(kind, seconds, payload=None, job_id=None):
+    return scheduler.schedule(kind, time.time() + seconds, payload, job_id)
+
+
+def has_job(job_id):
+    return job_id in scheduler.jobs
+
+
+def cancel_job(job_id):
+    return scheduler.cancel(job_id)
+
+
+def schedule_every(kind, seconds, handler, first_run=None):
+    scheduler.register(kind, handler)
+    return scheduler.every(kind, seconds, first_run)
+
+
+async def run_job_scheduler(client):
+    """Start the scheduler loop (call once from on_ready)."""
+    await scheduler.run(client)
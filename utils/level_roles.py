@@ -0,0 +1,142 @@
+import asyncio
+
+import discord
+
+from utils.ratelimit import call_with_backoff
+from utils.xp_rules import get_xp_rules
+
+#####################################################################################################
+# Level role rewards
+#
+# Level-ups never call the REST API from inside the XP tick. Instead the desired reward roles are
+# diffed against the member's cached roles and the difference is queued on a per-guild queue.
+# Pending changes for the same member are merged, so a burst of level-ups (or a full reconcile)
+# becomes at most one add and one remove call per member, paced to stay under the guild's rate
+# limit. Only the reward roles themselves are sent (add_roles/remove_roles), never the member's
+# whole role list, so roles granted by moderators or other bots in the meantime are kept.
+
+# Seconds between two member edits in the same guild
+EDIT_INTERVAL = 0.5
+
+
+class GuildRoleQueue:
+    def __init__(self, guild_id: int, client: discord.Client):
+        self.guild_id = guild_id
+        self._client = client
+        # member_id -> (role IDs to add, role IDs to remove), in arrival order
+        self.pending = {}
+        self._wake = asyncio.Event()
+        self._worker_task = asyncio.create_task(self._worker())
+
+    def enqueue(self, member_id, add=(), remove=()):
+        """Queue role changes for a member, merging with any change already pending."""
+        add, remove = set(add), set(remove)
+        pending_add, pending_remove = self.pending.pop(member_id, (set(), set()))
+
+        # The newest request wins when the same role is both added and removed
+        pending_add = (pending_add - remove) | add
+        pending_remove = (pending_remove - add) | remove
+
+        if pending_add or pending_remove:
+            self.pending[member_id] = (pending_add, pending_remove)
+            self._wake.set()
+
+    async def _worker(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+
+            while self.pending:
+                member_id = next(iter(self.pending))
+                add, remove = self.pending.pop(member_id)
+                try:
+                    if await self._apply(member_id, add, remove):
+                        await asyncio.sleep(EDIT_INTERVAL)
+                except Exception as e:
+                    print(f"Error applying level roles for member {member_id}: {e}")
+
+    async def _apply(self, member_id, add, remove):
+        """Apply one merged change. Returns True if a call was made."""
+        guild = self._client.get_guild(self.guild_id)
+        member = guild.get_member(member_id) if guild else None
+        if member is None:
+            return False
+
+        current = {role.id for role in member.roles}
+        to_add = [
+            role
+            for role in (guild.get_role(role_id) for role_id in add - current)
+            if role
+        ]
+        to_remove = [
+            role
+            for role in (guild.get_role(role_id) for role_id in remove & current)
+            if role
+        ]
+        if not to_add and not to_remove:
+            return False
+
+        try:
+            if to_add:
+                await call_with_backoff(
+                    lambda: member.add_roles(*to_add, reason="Level role rewards")
+                )
+            if to_remove:
+                await call_with_backoff(
+                    lambda: member.remove_roles(*to_remove, reason="Level role rewards")
+                )
+        except discord.Forbidden:
+            print(f"Missing permissions to update level roles in guild {guild.name}.")
+        except discord.HTTPException as e:
+            print(f"Failed to update level roles for {member.name}: {e}")
+        return True
+
+
+_role_queues = {}
+
+
+def get_role_queue(guild_id: int, client: discord.Client) -> GuildRoleQueue:
+    queue = _role_queues.get(guild_id)
+    if queue is None:
+        queue = GuildRoleQueue(guild_id, client)
+        _role_queues[guild_id] = queue
+    return queue
+
+
+def queue_level_roles(client, member, level):
+    """Diff the member's reward roles against their level and queue the difference.
+
+    Returns True if a change was queued.
+    """
+    rules = get_xp_rules(member.guild.id)
+    if not rules.reward_roles:
+        return False
+
+    desired = rules.desired_reward_roles(level)
+    current = {role.id for role in member.roles} & rules.reward_roles
+
+    add = desired - current
+    remove = current - desired
+    if not add and not remove:
+        return False
+
+    get_role_queue(member.guild.id, client).enqueue(member.id, add, remove)
+    return True
+
+
+def queue_reward_role_removal(client, guild, role_id):
+    """Take a role that is no longer a level reward away from every member holding it.
+
+    Returns how many members were queued. Nothing is queued if the role still rewards another
+    level (/sync-level-roles handles that case).
+    """
+    if role_id in get_xp_rules(guild.id).reward_roles:
+        return 0
+    role = guild.get_role(role_id)
+    if role is None:
+        return 0
+
+    queue = get_role_queue(guild.id, client)
+    for member in role.members:
+        queue.enqueue(member.id, remove={role_id})
+    return len(role.members)
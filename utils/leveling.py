@@ -1,13 +1,17 @@
 from PIL import Image, ImageDraw, ImageFont
 import requests
 from io import BytesIO
-from utils.data import load_data, save_data
 import random
-import asyncio
 import time
 import json
 import os
 from utils.const import SETTINGS_FILE
+from utils.jobs import schedule_every
+from utils.level_roles import queue_level_roles
+from utils.ranking import get_guild_rank
+from utils.store import get_store
+from utils.xp_rules import channel_category_id, get_xp_rules
+from utils.xp_windows import record_xp_gain, save_xp_windows
 import discord
 
 # from utils.client import setup_client
@@ -40,52 +44,15 @@ def calculate_level_and_thresholds(xp):
 
 def calculate_user_rank(user_id, guild_id):
     """Calculate the user's rank based on their XP in the server."""
-    # Load the data
-    data = load_data()
-    guild_id_str = str(guild_id)
-
-    if guild_id_str not in data:
-        return None  # No data for this server
-
-    # Get all users' XP data in the server
-    guild_data = data[guild_id_str]
-    users = []
-
-    for user_id_str, user_data in guild_data.items():
-        xp = user_data.get("xp", 0)
-        users.append((user_id_str, xp))
-
-    # Sort users by XP (highest to lowest)
-    users.sort(key=lambda x: x[1], reverse=True)
-
-    # Find the rank of the specific user
-    for rank, (user_id_str, xp) in enumerate(users, 1):
-        if user_id_str == str(user_id):
-            return rank  # Return rank (1-based)
-
-    return None  # In case the user is not found (shouldn't happen)
+    # Served from the incrementally maintained rank index instead of sorting the guild
+    return get_guild_rank(guild_id, user_id)
 
 
 #####################################################################################################
 # Function to check ignore channels
 def check_ignore_channel(channel_id, guild_id):
     """Check if the channel is ignored for XP."""
-    # Load the settings
-    if not os.path.exists(SETTINGS_FILE):
-        with open(SETTINGS_FILE, "w") as f:
-            json.dump({}, f)
-    with open(SETTINGS_FILE, "r") as f:
-        settings = json.load(f)
-
-    guild_settings = settings.get(str(guild_id), {})
-
-    ignore_channels = guild_settings.get("ignore_channel", [])
-
-    if channel_id in ignore_channels:
-        # print(f"Channel {channel_id} is ignored for XP")
-        return True
-
-    return False
+    return get_xp_rules(guild_id).is_ignored(channel_id)
 
 
 #####################################################################################################
@@ -95,9 +62,7 @@ def check_ignore_channel(channel_id, guild_id):
 # Need to pass the `client` object to send messages
 async def check_level_up(user_id, guild_id, oldlevel, client):
     """Check if the user leveled up after sending a message."""
-    data = load_data()
     guild_id_str = str(guild_id)
-    user_id_str = str(user_id)
 
     if not os.path.exists(SETTINGS_FILE):
         with open(SETTINGS_FILE, "w") as f:
@@ -107,10 +72,10 @@ async def check_level_up(user_id, guild_id, oldlevel, client):
 
     # print("Checking level up for user", user_id_str, "in guild", guild_id_str)
 
-    if guild_id_str not in data or user_id_str not in data[guild_id_str]:
+    user_data = get_store().get_user(guild_id, user_id)
+    if user_data is None:
         return  # No data for this server or user
 
-    user_data = data[guild_id_str][user_id_str]
     xp = user_data.get("xp", 0)
     level, _, _ = calculate_level_and_thresholds(xp)
     # print(xp - current_threshold)
@@ -118,6 +83,11 @@ async def check_level_up(user_id, guild_id, oldlevel, client):
     if level > oldlevel:
         guild = client.get_guild(guild_id)
         user = guild.get_member(user_id)
+
+        # Queue level role rewards (applied in the background by the guild's role queue)
+        if user:
+            queue_level_roles(client, user, level)
+
         # print("User", user_id_str, "leveled up to level", level)
         # Get the announcement channel for the guild
         settings_guild = settings.get(guild_id_str, {})
@@ -149,67 +119,71 @@ async def check_level_up(user_id, guild_id, oldlevel, client):
 
 # Need to pass the `client` object for checking level up
 async def increase_xp_periodically(member_last_activity, client):
-    while True:
-        await asyncio.sleep(30)  # Wait for 30 seconds
-
-        data = load_data()
-        # Load settings
-        if not os.path.exists(SETTINGS_FILE):
-            with open(SETTINGS_FILE, "w") as f:
-                json.dump({}, f)
-        with open(SETTINGS_FILE, "r") as f:
-            settings = json.load(f)
-
-        # Create a copy of member_last_activity to avoid modifying while iterating
-        activity_snapshot = member_last_activity.copy()
-
-        for guild_id, guild_data in data.items():
-            int_guild_id = int(guild_id)
-
-            # Skip the guild if the level-up system is disabled
-            guild_settings = settings.get(str(guild_id), {})
-            if not guild_settings.get("level", True):
-                continue
-
-            # Skip if the guild has no activity data
-            if int_guild_id not in activity_snapshot:
-                continue
+    """Award activity XP every 30 seconds from the job scheduler."""
 
-            # Process users in the guild with activity
-            for user_id, user_data in guild_data.items():
-                int_user_id = int(user_id)
+    async def _xp_tick(client, payload):
+        await award_activity_xp(member_last_activity, client)
 
-                # Skip if the user has no activity data
-                for channel_id in activity_snapshot.get(int_guild_id, {}):
-                    if int_user_id not in activity_snapshot[int_guild_id].get(channel_id, {}):
-                        continue
+    schedule_every("xp_tick", 30, _xp_tick)
 
-                    # Check if the channel is ignored for XP
-                    if check_ignore_channel(channel_id, guild_id):
-                        continue
 
-                    # Get the last activity time for the user
-                    last_activity_time = activity_snapshot[int_guild_id][channel_id][int_user_id]
+async def award_activity_xp(member_last_activity, client):
+    """One XP tick: credit members who chatted in the last 30 seconds."""
+    store = get_store()
 
-                    # Calculate the time difference since the last activity
-                    time_diff = time.time() - last_activity_time
+    # Create a copy of member_last_activity to avoid modifying while iterating
+    activity_snapshot = member_last_activity.copy()
+    level_checks = []
 
-                    # Filter out users inactive more than 30 seconds
-                    if time_diff > 30:
-                        continue
+    # Only guilds and members with recent activity are visited
+    for int_guild_id, guild_activity in activity_snapshot.items():
+        # Skip the guild if the level-up system is disabled
+        rules = get_xp_rules(int_guild_id)
+        if not rules.enabled:
+            continue
 
-                    oldlevel, _, _ = calculate_level_and_thresholds(user_data["xp"])
-                    # Add random XP between 4 and 8
-                    xp_to_add = random.randint(4, 8)
-                    user_data["xp"] += xp_to_add
+        guild = client.get_guild(int_guild_id)
 
-                    save_data(data)
-
-                    # Check if the user leveled up
-                    await check_level_up(int_user_id, int_guild_id, oldlevel, client)
-
-        # Clear the activity tracking dictionary after iteration
-        member_last_activity.clear()
+        for channel_id, channel_activity in guild_activity.items():
+            # Check if the channel is ignored for XP
+            if rules.is_ignored(channel_id):
+                continue
+            category_id = channel_category_id(guild, channel_id)
+
+            for int_user_id, last_activity_time in channel_activity.items():
+                # Calculate the time difference since the last activity
+                time_diff = time.time() - last_activity_time
+
+                # Filter out users inactive more than 30 seconds
+                if time_diff > 30:
+                    continue
+
+                # Add random XP between 4 and 8, scaled by the guild's multiplier rules
+                member = guild.get_member(int_user_id) if guild else None
+                role_ids = [role.id for role in member.roles] if member else ()
+                xp_to_add = round(
+                    random.randint(4, 8)
+                    * rules.multiplier(channel_id, role_ids, category_id=category_id)
+                )
+                if xp_to_add <= 0:
+                    continue
+
+                old_xp, _ = store.add_xp(int_guild_id, int_user_id, xp_to_add)
+                oldlevel, _, _ = calculate_level_and_thresholds(old_xp)
+                record_xp_gain(int_guild_id, int_user_id, xp_to_add)
+                level_checks.append((int_user_id, int_guild_id, oldlevel))
+
+    # Persist the store and the rolling leaderboard buckets once per tick
+    if level_checks:
+        store.save()
+        save_xp_windows()
+
+    # Check if the users leveled up
+    for int_user_id, int_guild_id, oldlevel in level_checks:
+        await check_level_up(int_user_id, int_guild_id, oldlevel, client)
+
+    # Clear the activity tracking dictionary after iteration
+    member_last_activity.clear()
 
 
 #####################################################################################################
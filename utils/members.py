@@ -0,0 +1,203 @@
+import json
+import os
+import time
+
+from utils.const import (
+    ARCHIVE_FILE,
+    COMPACTION_STATE_FILE,
+    SETTINGS_FILE,
+    current_time,
+)
+from utils.jobs import schedule_every
+from utils.store import get_store, UNKNOWN_BDATE
+
+#####################################################################################################
+# Member registration
+#
+# Every member gets a default record ({"bdate": "Unknown", "xp": 0}). Joins used to load and
+# rewrite the whole data file one member at a time; now a guild is registered in bulk from its
+# member chunk when the bot starts or joins it, and single joins only touch the in-memory store.
+# Unsaved records are written by a periodic flush, so a raid costs no file I/O per join.
+
+STORE_FLUSH_SECONDS = 60
+COMPACTION_INTERVAL = 24 * 60 * 60
+# Days a departed member's (or removed guild's) data is kept; settings "retention_days"
+DEFAULT_RETENTION_DAYS = 30
+
+
+async def register_guild_members(guild):
+    """Create missing records for every member of the guild in one batch and save once.
+
+    Returns how many records were created.
+    """
+    if not guild.chunked:
+        await guild.chunk()
+
+    store = get_store()
+    created = store.ensure_users(
+        guild.id, [member.id for member in guild.members if not member.bot]
+    )
+    if created:
+        store.save()
+        print(f"{current_time()} - Registered {created} member(s) of {guild.name}.")
+    return created
+
+
+async def register_all_members(client):
+    """Register every guild's members, then start the periodic store flush."""
+    for guild in client.guilds:
+        try:
+            await register_guild_members(guild)
+        except Exception as e:
+            print(f"Error registering members of {guild.name}: {e}")
+
+    schedule_every("store_flush", STORE_FLUSH_SECONDS, flush_store)
+    # Member caches are complete now, so departed members can be told apart
+    schedule_every("store_compaction", COMPACTION_INTERVAL, compact_store, time.time())
+
+
+def register_member(member):
+    """Add a default record for a new member (in memory; saved by the next flush)."""
+    if not member.bot:
+        get_store().ensure_user(member.guild.id, member.id)
+
+
+async def flush_store(client, payload=None):
+    try:
+        get_store().flush()
+    except IOError as e:
+        print(f"Error writing data file: {e}")
+
+
+#####################################################################################################
+# Compaction
+#
+# Records of members who left, and of guilds the bot was removed from, used to stay in data.json
+# forever. The compaction job diffs each guild's stored user IDs against its member cache as
+# sets. Departed users are marked with the time they were first seen missing (persisted, so the
+# retention period survives restarts). Default records carry nothing and are dropped right away;
+# records with XP or a birthday are moved to archive.json once the guild's retention period has
+# passed. Members who come back before then keep their record untouched.
+
+
+def _load_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError as e:
+        print(f"Error reading {path}, starting empty: {e}")
+        return {}
+
+
+def _save_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _retention_seconds(guild_settings):
+    days = guild_settings.get("retention_days", DEFAULT_RETENTION_DAYS)
+    return max(0, int(days)) * 24 * 60 * 60
+
+
+def _is_default_record(user_data):
+    return user_data.get("xp", 0) == 0 and user_data.get("bdate") == UNKNOWN_BDATE
+
+
+def compact_guilds(store, present_members, settings, departed, archive, now=None):
+    """Pick the records of users missing from `present_members` to drop or archive.
+
+    present_members: {guild_id (str): set of member IDs (str)}; guilds missing from it are
+    skipped (an empty set means the bot left the guild). departed: {guild_id: {user_id: first
+    seen missing}} and archive: {guild_id: {user_id: record}} are updated in place. The store
+    is not changed: the caller deletes the returned keys once the archive is safely written.
+    Returns ([(guild_id, user_id)] to delete, dropped, archived).
+    """
+    now = time.time() if now is None else now
+    dropped = archived = 0
+    removed = []
+
+    for guild_id in list(store.guilds):
+        members = present_members.get(guild_id)
+        if members is None:
+            continue  # Member cache incomplete; cannot tell who left
+
+        stored = set(store.guilds[guild_id])
+        gone = stored - members
+        marks = departed.setdefault(guild_id, {})
+
+        # Forget members who came back, mark newly departed ones
+        for user_id in set(marks) - gone:
+            del marks[user_id]
+        for user_id in gone - set(marks):
+            marks[user_id] = now
+
+        retention = _retention_seconds(settings.get(guild_id, {}))
+        for user_id in gone:
+            user_data = store.get_user(guild_id, user_id)
+            if _is_default_record(user_data):
+                dropped += 1
+            elif now - marks[user_id] >= retention:
+                archive.setdefault(guild_id, {})[user_id] = dict(
+                    user_data, archived_at=int(now)
+                )
+                archived += 1
+            else:
+                continue
+            removed.append((guild_id, user_id))
+            del marks[user_id]
+
+        if not marks:
+            del departed[guild_id]
+
+    return removed, dropped, archived
+
+
+async def compact_store(client, payload=None):
+    """Compaction job: prune departed members and removed guilds, then save once."""
+    store = get_store()
+    settings = _load_json(SETTINGS_FILE)
+    departed = _load_json(COMPACTION_STATE_FILE)
+    archive = _load_json(ARCHIVE_FILE)
+
+    present_members = {}
+    for guild in client.guilds:
+        if guild.chunked:
+            present_members[str(guild.id)] = {str(member.id) for member in guild.members}
+
+    # A guild the bot is no longer in has no members left
+    current_guild_ids = {str(guild.id) for guild in client.guilds}
+    for guild_id in store.guilds:
+        if guild_id not in current_guild_ids:
+            present_members[guild_id] = set()
+
+    removed, dropped, archived = compact_guilds(
+        store, present_members, settings, departed, archive
+    )
+
+    # The archive is written first: if that fails, the records stay in the store and the next
+    # run tries again, instead of data.json losing them with no archived copy
+    try:
+        if archived:
+            _save_json(ARCHIVE_FILE, archive)
+    except IOError as e:
+        print(f"Error writing archive, nothing compacted: {e}")
+        return
+
+    try:
+        for guild_id, user_id in removed:
+            store.delete_user(guild_id, user_id)
+        if removed:
+            store.save()
+        _save_json(COMPACTION_STATE_FILE, departed)
+    except IOError as e:
+        print(f"Error writing compaction results: {e}")
+        return
+
+    print(
+        f"{current_time()} - Store compaction: {dropped} empty record(s) dropped, "
+        f"{archived} archived, {sum(map(len, departed.values()))} pending retention."
+    )
@@ -0,0 +1,141 @@
+import asyncio
+
+from utils.db import close_pool, get_connection
+
+#####################################################################################################
+# Database schema migrations
+#
+# The backup schema is versioned: schema_version records every migration applied, and
+# apply_migrations() runs the missing ones in order. MySQL commits DDL implicitly, so each
+# migration is written to be safe to re-run (IF NOT EXISTS, existence checks) in case the bot
+# stopped between a migration and its version row. Run on every full backup (including the first
+# one after startup) or by hand with `python -m utils.migrations`.
+#
+# Add a migration by appending (version, description, coroutine(cursor)) to MIGRATIONS; never
+# edit one that has shipped.
+
+
+async def _index_exists(cursor, table, index):
+    await cursor.execute(
+        """
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+        """,
+        (table, index),
+    )
+    return await cursor.fetchone() is not None
+
+
+async def _create_tables(cursor):
+    # Same layout create_tables() used before migrations, so existing databases are unchanged
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS settings (
+            guild_id VARCHAR(50) PRIMARY KEY,
+            birthday_role VARCHAR(100),
+            birthday_channel VARCHAR(100),
+            data_channel VARCHAR(100),
+            announcement_channel VARCHAR(100),
+            level BOOLEAN
+        )
+        """
+    )
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_data (
+            guild_id VARCHAR(50),
+            user_id VARCHAR(50),
+            bdate VARCHAR(10),
+            xp INT,
+            PRIMARY KEY (guild_id, user_id)
+        )
+        """
+    )
+
+
+async def _snowflake_columns(cursor):
+    # Discord IDs are 64-bit snowflakes: 8 bytes instead of up to 50 characters per ID, and
+    # numeric comparisons in the primary key. XP gets the same headroom.
+    await cursor.execute("ALTER TABLE settings MODIFY guild_id BIGINT UNSIGNED NOT NULL")
+    await cursor.execute(
+        """
+        ALTER TABLE user_data
+            MODIFY guild_id BIGINT UNSIGNED NOT NULL,
+            MODIFY user_id BIGINT UNSIGNED NOT NULL,
+            MODIFY xp BIGINT NOT NULL DEFAULT 0
+        """
+    )
+
+
+async def _leaderboard_index(cursor):
+    # Guild leaderboards (WHERE guild_id = ? ORDER BY xp DESC LIMIT n) read the top of this
+    # index instead of sorting the guild's whole partition
+    if not await _index_exists(cursor, "user_data", "idx_user_data_guild_xp"):
+        await cursor.execute(
+            "CREATE INDEX idx_user_data_guild_xp ON user_data (guild_id, xp DESC)"
+        )
+
+
+MIGRATIONS = [
+    (1, "Create settings and user_data tables", _create_tables),
+    (2, "Store snowflake IDs and XP as BIGINT", _snowflake_columns),
+    (3, "Add (guild_id, xp DESC) leaderboard index", _leaderboard_index),
+]
+
+
+async def get_schema_version(cursor):
+    # Checked first so the common case (nothing to do) does not log an "already exists" warning
+    await cursor.execute("SHOW TABLES LIKE 'schema_version'")
+    if await cursor.fetchone() is None:
+        await cursor.execute(
+            """
+        CREATE TABLE schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+        )
+    await cursor.execute("SELECT MAX(version) FROM schema_version")
+    (version,) = await cursor.fetchone()
+    return version or 0
+
+
+async def apply_migrations():
+    """Bring the database schema up to date. Returns True if it is current."""
+    async with get_connection() as connection:
+        if not connection:
+            return False
+
+        try:
+            async with connection.cursor() as cursor:
+                current = await get_schema_version(cursor)
+                for version, description, migrate in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    print(f"Applying database migration {version}: {description}")
+                    await migrate(cursor)
+                    await cursor.execute(
+                        "INSERT IGNORE INTO schema_version (version, description) "
+                        "VALUES (%s, %s)",
+                        (version, description),
+                    )
+                    await connection.commit()
+            return True
+
+        except Exception as e:
+            print(f"Error applying database migrations: {e}")
+            return False
+
+
+async def run_migrations():
+    try:
+        if await apply_migrations():
+            print("Database schema is up to date.")
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_migrations())
@@ -0,0 +1,282 @@
+from bisect import bisect_left, bisect_right, insort
+
+#####################################################################################################
+# XP rank indexes
+#
+# Ranks used to be computed by loading data.json and sorting the whole guild for every lookup.
+# These indexes are built once when the data store loads and then kept up to date by its writes,
+# so a per-guild or cross-guild rank is a logarithmic lookup in a bucketed sorted list of XP
+# values.
+
+
+def _as_xp(value):
+    """Stored XP may be missing or "Unknown"; treat anything non-numeric as 0."""
+    return value if isinstance(value, int) else 0
+
+
+class XpRankIndex:
+    """Sorted multiset of XP values. rank(xp) = 1 + number of entries with more XP.
+
+    A bucketed sorted list (the layout sortedcontainers uses): the values live in sorted buckets
+    of at most 2 * LOAD entries, with each bucket's maximum kept for bisecting and a Fenwick tree
+    over the bucket sizes for counting. An add or remove bisects to one bucket and shifts at most
+    2 * LOAD entries there; a rank is two bisects and a Fenwick prefix sum. Both are O(log n)
+    plus a bounded shift, instead of the O(n) shift of one flat sorted list. The Fenwick tree is
+    rebuilt (O(number of buckets)) only when a bucket is split or emptied.
+    """
+
+    LOAD = 512
+
+    __slots__ = ("_buckets", "_maxes", "_tree", "_len")
+
+    def __init__(self, values=()):
+        self._build(sorted(values))
+
+    def __len__(self):
+        return self._len
+
+    def _build(self, values):
+        load = self.LOAD
+        self._buckets = [values[i : i + load] for i in range(0, len(values), load)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._len = len(values)
+        self._tree = None
+
+    def _values(self):
+        return [xp for bucket in self._buckets for xp in bucket]
+
+    def _fenwick(self):
+        if self._tree is None:
+            # tree[i] (1-based) sums the sizes of buckets (i - lowbit(i), i]
+            tree = [0] + [len(bucket) for bucket in self._buckets]
+            for i in range(1, len(tree)):
+                parent = i + (i & -i)
+                if parent < len(tree):
+                    tree[parent] += tree[i]
+            self._tree = tree
+        return self._tree
+
+    def _resize(self, pos, delta):
+        # A tree waiting to be rebuilt picks up the new size anyway
+        tree = self._tree
+        if tree is not None:
+            i = pos + 1
+            while i < len(tree):
+                tree[i] += delta
+                i += i & -i
+
+    def _count_before(self, pos):
+        """Number of entries in the buckets before `pos`."""
+        tree = self._fenwick()
+        total = 0
+        while pos > 0:
+            total += tree[pos]
+            pos -= pos & -pos
+        return total
+
+    def add(self, xp):
+        self._len += 1
+        if not self._buckets:
+            self._buckets.append([xp])
+            self._maxes.append(xp)
+            self._tree = None
+            return
+
+        pos = bisect_right(self._maxes, xp)
+        if pos == len(self._buckets):
+            # Above every value: append to the last bucket
+            pos -= 1
+            self._buckets[pos].append(xp)
+            self._maxes[pos] = xp
+        else:
+            insort(self._buckets[pos], xp)
+
+        bucket = self._buckets[pos]
+        if len(bucket) > 2 * self.LOAD:
+            self._buckets.insert(pos + 1, bucket[self.LOAD :])
+            del bucket[self.LOAD :]
+            self._maxes.insert(pos, bucket[-1])
+            self._tree = None
+        else:
+            self._resize(pos, 1)
+
+    def remove(self, xp):
+        pos = bisect_left(self._maxes, xp)
+        if pos == len(self._buckets):
+            return
+        bucket = self._buckets[pos]
+        i = bisect_left(bucket, xp)
+        if bucket[i] != xp:
+            return
+
+        self._len -= 1
+        del bucket[i]
+        if not bucket:
+            del self._buckets[pos]
+            del self._maxes[pos]
+            self._tree = None
+        else:
+            self._maxes[pos] = bucket[-1]
+            self._resize(pos, -1)
+
+    def add_many(self, values):
+        # Timsort merges the two sorted runs in linear time
+        merged = self._values()
+        merged.extend(values)
+        merged.sort()
+        self._build(merged)
+
+    def update(self, old_xp, new_xp):
+        self.remove(old_xp)
+        self.add(new_xp)
+
+    def rank(self, xp):
+        pos = bisect_right(self._maxes, xp)
+        if pos == len(self._buckets):
+            return 1
+        not_above = self._count_before(pos) + bisect_right(self._buckets[pos], xp)
+        return self._len - not_above + 1
+
+
+# user_id -> {guild_id: xp}
+_user_guild_xp = {}
+# guild_id -> XpRankIndex of every user's XP in that guild
+_guild_ranks = {}
+# XpRankIndex of every user's total XP across all guilds
+_global_rank = XpRankIndex()
+_built = False
+
+
+def _ensure_built():
+    if not _built:
+        # Loading the store rebuilds the index (imported here to avoid a circular import)
+        from utils.store import get_store
+
+        get_store()
+
+
+def rebuild_rank_index(guilds):
+    """Rebuild every index from {guild_id: {user_id: {"xp": ...}}} in one pass."""
+    global _built, _global_rank
+    _built = True
+    _user_guild_xp.clear()
+    _guild_ranks.clear()
+
+    guild_values = {}
+    for guild_id, users in guilds.items():
+        guild_id = int(guild_id)
+        values = guild_values.setdefault(guild_id, [])
+        for user_id, user_data in users.items():
+            xp = _as_xp(user_data.get("xp", 0))
+            _user_guild_xp.setdefault(int(user_id), {})[guild_id] = xp
+            values.append(xp)
+
+    for guild_id, values in guild_values.items():
+        _guild_ranks[guild_id] = XpRankIndex(values)
+    _global_rank = XpRankIndex(
+        sum(entries.values()) for entries in _user_guild_xp.values()
+    )
+
+
+def update_user_xp(guild_id, user_id, xp):
+    """Record the user's new XP in a guild, creating the entry if needed."""
+    _ensure_built()
+    guild_id, user_id, xp = int(guild_id), int(user_id), _as_xp(xp)
+
+    entries = _user_guild_xp.setdefault(user_id, {})
+    old_total = sum(entries.values()) if entries else None
+    old_xp = entries.get(guild_id)
+    entries[guild_id] = xp
+
+    guild_rank = _guild_ranks.setdefault(guild_id, XpRankIndex())
+    if old_xp is None:
+        guild_rank.add(xp)
+    else:
+        guild_rank.update(old_xp, xp)
+
+    if old_total is None:
+        _global_rank.add(xp)
+    else:
+        _global_rank.update(old_total, old_total - (old_xp or 0) + xp)
+
+
+def add_user_entries(guild_id, user_ids):
+    """Add 0 XP entries for many new users of a guild at once (bulk member registration)."""
+    _ensure_built()
+    guild_id = int(guild_id)
+
+    new_in_guild = 0
+    new_globally = 0
+    for user_id in user_ids:
+        entries = _user_guild_xp.setdefault(int(user_id), {})
+        if guild_id in entries:
+            continue
+        if not entries:
+            new_globally += 1
+        # A 0 XP entry leaves an existing user's total unchanged
+        entries[guild_id] = 0
+        new_in_guild += 1
+
+    if new_in_guild:
+        _guild_ranks.setdefault(guild_id, XpRankIndex()).add_many([0] * new_in_guild)
+    if new_globally:
+        _global_rank.add_many([0] * new_globally)
+
+
+def remove_user_entry(guild_id, user_id):
+    """Forget the user's XP entry in a guild (e.g. their record was deleted)."""
+    _ensure_built()
+    guild_id, user_id = int(guild_id), int(user_id)
+
+    entries = _user_guild_xp.get(user_id)
+    if not entries or guild_id not in entries:
+        return
+
+    old_total = sum(entries.values())
+    old_xp = entries.pop(guild_id)
+    _guild_ranks[guild_id].remove(old_xp)
+
+    if entries:
+        _global_rank.update(old_total, old_total - old_xp)
+    else:
+        _global_rank.remove(old_total)
+        del _user_guild_xp[user_id]
+
+
+def get_guild_rank(guild_id, user_id):
+    """Return the user's 1-based rank in the guild, or None if they have no entry."""
+    _ensure_built()
+    xp = _user_guild_xp.get(int(user_id), {}).get(int(guild_id))
+    if xp is None:
+        return None
+    return _guild_ranks[int(guild_id)].rank(xp)
+
+
+def get_user_profile(user_id):
+    """Return the user's per-guild and global standing, or None if they have no entries.
+
+    {
+        "guilds": [(guild_id, xp, rank, members_ranked)],  # highest XP first
+        "total_xp": int,
+        "global_rank": int,
+        "global_users": int,
+    }
+    """
+    _ensure_built()
+    entries = _user_guild_xp.get(int(user_id))
+    if not entries:
+        return None
+
+    guilds = [
+        (guild_id, xp, _guild_ranks[guild_id].rank(xp), len(_guild_ranks[guild_id]))
+        for guild_id, xp in entries.items()
+    ]
+    guilds.sort(key=lambda x: x[1], reverse=True)
+
+    total_xp = sum(entries.values())
+    return {
+        "guilds": guilds,
+        "total_xp": total_xp,
+        "global_rank": _global_rank.rank(total_xp),
+        "global_users": len(_global_rank),
+    }
@@ -0,0 +1,48 @@
+import asyncio
+import random
+
+import discord
+
+#####################################################################################################
+# Retrying Discord REST calls
+#
+# discord.py already sleeps through most 429s, but a rate limit that exceeds its own threshold,
+# a 5xx from Discord or a dropped connection still surfaces as an exception. Bulk jobs (role
+# syncs, birthday runs) should back off and retry those instead of silently skipping the member.
+
+MAX_ATTEMPTS = 4
+BASE_DELAY = 1.0
+MAX_DELAY = 30.0
+
+
+def _retry_delay(error, attempt):
+    """Seconds to wait before the next attempt, or None if the error is not retryable."""
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if isinstance(error, (discord.Forbidden, discord.NotFound)):
+        return None
+    if isinstance(error, discord.HTTPException):
+        if error.status == 429:
+            headers = error.response.headers if error.response is not None else {}
+            retry_after = headers.get("Retry-After")
+            return float(retry_after) if retry_after else BASE_DELAY * 2**attempt
+        if error.status < 500:
+            return None
+    # 5xx and connection errors: exponential backoff with a little jitter
+    return min(MAX_DELAY, BASE_DELAY * 2**attempt) + random.uniform(0, BASE_DELAY)
+
+
+async def call_with_backoff(action, attempts=MAX_ATTEMPTS):
+    """Await `action()` (a zero-argument coroutine factory), retrying transient failures.
+
+    Forbidden, NotFound and other 4xx errors are raised immediately; the last error is raised
+    once every attempt has failed.
+    """
+    for attempt in range(attempts):
+        try:
+            return await action()
+        except (discord.HTTPException, discord.RateLimited, OSError) as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None or attempt == attempts - 1:
+                raise
+            await asyncio.sleep(delay)
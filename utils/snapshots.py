@@ -0,0 +1,344 @@
+import asyncio
+from datetime import datetime, timezone
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+
+from utils.const import DATA_FILE, SETTINGS_FILE, SNAPSHOT_DIR, current_time
+from utils.jobs import schedule_every
+from utils.store import get_store, UNKNOWN_BDATE
+
+#####################################################################################################
+# Local snapshots
+#
+# A backup target that needs no database server: every SNAPSHOT_INTERVAL the store is written to
+# SNAPSHOT_DIR as a gzip-compressed JSON Lines file:
+#
+#   {"format": "wizzie-snapshot", "version": 1, "created": "...", "guilds": n, "users": n}
+#   {"settings": {...settings.json...}}
+#   {"guild_id": "...", "user_id": "...", "bdate": "dd-mm", "xp": 0}     (one line per user)
+#   {"sha256": "...", "records": n}
+#
+# The last line is the SHA-256 of every line before it, so a truncated or corrupted file is
+# detected before anything is restored from it. The file is written from a copy-on-write
+# snapshot of the store in a worker thread (the bot keeps running) and renamed into place.
+#
+# Rotation keeps the newest KEEP_HOURLY snapshots, plus the newest one of each of the last
+# KEEP_DAILY days and KEEP_WEEKLY weeks; everything else is deleted.
+#
+#   python -m utils.snapshots create | list | restore [file] [--force]
+
+SNAPSHOT_FORMAT = "wizzie-snapshot"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_INTERVAL = 60 * 60
+SNAPSHOT_PREFIX = "snapshot-"
+SNAPSHOT_SUFFIX = ".jsonl.gz"
+SNAPSHOT_TIME_FORMAT = "%Y%m%dT%H%M%SZ"
+
+KEEP_HOURLY = 24
+KEEP_DAILY = 7
+KEEP_WEEKLY = 4
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_path(created, directory=SNAPSHOT_DIR):
+    name = f"{SNAPSHOT_PREFIX}{created.strftime(SNAPSHOT_TIME_FORMAT)}{SNAPSHOT_SUFFIX}"
+    return os.path.join(directory, name)
+
+
+def list_snapshots(directory=SNAPSHOT_DIR):
+    """Return [(created, path)] of the snapshots in `directory`, newest first."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+
+    snapshots = []
+    for name in names:
+        if not (name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)):
+            continue
+        stamp = name[len(SNAPSHOT_PREFIX) : -len(SNAPSHOT_SUFFIX)]
+        try:
+            created = datetime.strptime(stamp, SNAPSHOT_TIME_FORMAT)
+        except ValueError:
+            continue
+        created = created.replace(tzinfo=timezone.utc)
+        snapshots.append((created, os.path.join(directory, name)))
+    snapshots.sort(reverse=True)
+    return snapshots
+
+
+#####################################################################################################
+# Writing
+
+
+def _encode(record):
+    return (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def write_snapshot(path, guilds, settings, created):
+    """Write a snapshot file atomically. Returns the number of user records written.
+
+    `guilds` must not change while this runs (pass a store snapshot); safe to call from a
+    worker thread.
+    """
+    digest = hashlib.sha256()
+    records = 0
+    tmp_path = f"{path}.tmp"
+
+    with gzip.open(tmp_path, "wb") as f:
+
+        def write(record):
+            line = _encode(record)
+            digest.update(line)
+            f.write(line)
+
+        write(
+            {
+                "format": SNAPSHOT_FORMAT,
+                "version": SNAPSHOT_VERSION,
+                "created": created.isoformat(),
+                "guilds": len(guilds),
+                "users": sum(len(guild_data) for guild_data in guilds.values()),
+            }
+        )
+        write({"settings": settings})
+        for guild_id, guild_data in guilds.items():
+            for user_id, user_data in guild_data.items():
+                write(
+                    {
+                        "guild_id": guild_id,
+                        "user_id": user_id,
+                        "bdate": user_data["bdate"],
+                        "xp": user_data["xp"],
+                    }
+                )
+                records += 1
+        f.write(_encode({"sha256": digest.hexdigest(), "records": records}))
+
+    os.replace(tmp_path, path)
+    return records
+
+
+def _load_settings():
+    try:
+        with open(SETTINGS_FILE, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+async def create_snapshot(directory=SNAPSHOT_DIR):
+    """Snapshot the store and settings.json into `directory`, then rotate. Returns the path."""
+    os.makedirs(directory, exist_ok=True)
+    created = datetime.now(timezone.utc).replace(microsecond=0)
+    path = snapshot_path(created, directory)
+    settings = _load_settings()
+
+    started = time.perf_counter()
+    with get_store().snapshot() as guilds:
+        records = await asyncio.to_thread(
+            write_snapshot, path, guilds, settings, created
+        )
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{current_time()} - Snapshot {os.path.basename(path)} written "
+        f"({records} users, {os.path.getsize(path) / 1024:.0f} KiB, {elapsed:.2f}s)."
+    )
+    rotate_snapshots(directory)
+    return path
+
+
+#####################################################################################################
+# Rotation
+
+
+def snapshots_to_keep(
+    snapshots, hourly=KEEP_HOURLY, daily=KEEP_DAILY, weekly=KEEP_WEEKLY
+):
+    """Pick the snapshots to keep from [(created, path)] sorted newest first. Returns paths."""
+    keep = {path for _, path in snapshots[:hourly]}
+    days = set()
+    weeks = set()
+    for created, path in snapshots:
+        day = created.date()
+        if day not in days and len(days) < daily:
+            days.add(day)
+            keep.add(path)
+        week = created.isocalendar()[:2]
+        if week not in weeks and len(weeks) < weekly:
+            weeks.add(week)
+            keep.add(path)
+    return keep
+
+
+def rotate_snapshots(directory=SNAPSHOT_DIR):
+    """Delete the snapshots that fall out of the hourly/daily/weekly windows."""
+    snapshots = list_snapshots(directory)
+    keep = snapshots_to_keep(snapshots)
+    for _, path in snapshots:
+        if path not in keep:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Error deleting old snapshot {path}: {e}")
+
+
+async def snapshot_task(client=None, payload=None):
+    try:
+        await create_snapshot()
+    except OSError as e:
+        print(f"Error writing snapshot: {e}")
+
+
+async def start_snapshots():
+    """Write a snapshot every SNAPSHOT_INTERVAL (the first one right away)."""
+    schedule_every("snapshot", SNAPSHOT_INTERVAL, snapshot_task, time.time())
+    print("Snapshot task started.")
+
+
+#####################################################################################################
+# Reading and restoring
+
+
+def iter_snapshot(path):
+    """Stream a snapshot: yields the header, then the settings, then one dict per user.
+
+    The checksum is verified after the last user, so consumers that act on records as they
+    arrive (rather than collecting them) must be ready to discard their work. Raises
+    SnapshotError if the file is truncated, corrupted or not a snapshot.
+    """
+    digest = hashlib.sha256()
+    footer = None
+    records = 0
+
+    try:
+        with gzip.open(path, "rb") as f:
+            line = f.readline()
+            header = json.loads(line or b"{}")
+            if header.get("format") != SNAPSHOT_FORMAT:
+                raise SnapshotError("not a snapshot file")
+            if header.get("version") != SNAPSHOT_VERSION:
+                version = header.get("version")
+                raise SnapshotError(f"unsupported version {version}")
+            digest.update(line)
+            yield header
+
+            for line in f:
+                if footer is not None:
+                    raise SnapshotError("data after the checksum line")
+                record = json.loads(line)
+                if "sha256" in record:
+                    footer = record
+                    continue
+                digest.update(line)
+                if "settings" in record:
+                    yield record["settings"]
+                else:
+                    records += 1
+                    yield record
+    except (OSError, EOFError, ValueError) as e:
+        raise SnapshotError(f"unreadable snapshot: {e}") from e
+
+    if footer is None:
+        raise SnapshotError("missing checksum (truncated file?)")
+    if footer["sha256"] != digest.hexdigest() or footer.get("records") != records:
+        raise SnapshotError("checksum mismatch")
+
+
+def read_snapshot(path):
+    """Read and verify a snapshot. Returns (header, settings, guilds).
+
+    Raises SnapshotError if the file is truncated, corrupted or not a snapshot.
+    """
+    records = iter_snapshot(path)
+    header = next(records)
+    settings = next(records, {})
+    guilds = {}
+    try:
+        for record in records:
+            guilds.setdefault(record["guild_id"], {})[record["user_id"]] = {
+                "bdate": record.get("bdate") or UNKNOWN_BDATE,
+                "xp": int(record.get("xp") or 0),
+            }
+    except (KeyError, TypeError, ValueError) as e:
+        raise SnapshotError(f"unreadable snapshot: {e}") from e
+    return header, settings, guilds
+
+
+def latest_snapshot(directory=SNAPSHOT_DIR):
+    """Return (path, header, settings, guilds) of the newest valid snapshot, or None."""
+    for _, path in list_snapshots(directory):
+        try:
+            return (path, *read_snapshot(path))
+        except SnapshotError as e:
+            print(f"Skipping snapshot {path}: {e}")
+    return None
+
+
+def restore_snapshot(path=None, directory=SNAPSHOT_DIR):
+    """Replace data.json and settings.json with a snapshot (the newest valid one by default).
+
+    Returns True on success.
+    """
+    if path is None:
+        found = latest_snapshot(directory)
+        if found is None:
+            print(f"No valid snapshot found in {directory}.")
+            return False
+        path, header, settings, guilds = found
+    else:
+        try:
+            header, settings, guilds = read_snapshot(path)
+        except SnapshotError as e:
+            print(f"Cannot restore {path}: {e}")
+            return False
+
+    try:
+        get_store().restore(guilds)
+        tmp_path = f"{SETTINGS_FILE}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(settings, file, indent=4)
+        os.replace(tmp_path, SETTINGS_FILE)
+    except IOError as e:
+        print(f"Error writing restored data: {e}")
+        return False
+
+    print(
+        f"Restored {os.path.basename(path)} from {header['created']} "
+        f"({header['users']} users in {header['guilds']} guilds)."
+    )
+    return True
+
+
+def _print_snapshots(directory=SNAPSHOT_DIR):
+    snapshots = list_snapshots(directory)
+    if not snapshots:
+        print(f"No snapshots in {directory}.")
+    for created, path in snapshots:
+        size = os.path.getsize(path) / 1024
+        print(f"{created.strftime('%Y-%m-%d %H:%M:%S')} UTC  {size:8.0f} KiB  {path}")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "create"
+    if command == "create":
+        asyncio.run(create_snapshot())
+    elif command == "list":
+        _print_snapshots()
+    elif command == "restore":
+        args = [arg for arg in sys.argv[2:] if arg != "--force"]
+        if os.path.exists(DATA_FILE) and "--force" not in sys.argv:
+            print(f"{DATA_FILE} exists; use --force to overwrite it with the snapshot.")
+            sys.exit(1)
+        sys.exit(0 if restore_snapshot(args[0] if args else None) else 1)
+    else:
+        print("Usage: python -m utils.snapshots [create | list | restore [file] [--force]]")
+        sys.exit(1)
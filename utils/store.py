@@ -0,0 +1,353 @@
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+import json
+import os
+
+from utils.const import DATA_FILE
+from utils import ranking
+from utils.zodiac import get_zodiac
+
+#####################################################################################################
+# Data store
+#
+# data.json used to be loaded and rewritten by every feature on its own (the birthday module even
+# kept a private copy loaded at import, so its saves could undo XP gains). The store is now the
+# single in-memory owner of that data: features read and write through it and it keeps the
+# derived indexes (birthday-by-day, XP ranks) in step with every write.
+#
+# Layout is unchanged: {guild_id: {user_id: {"bdate": "dd-mm" | "Unknown", "xp": int}}} with
+# string IDs, exactly as persisted.
+#
+# Backups read a point-in-time snapshot (see snapshot()) while the XP tick and birthday code keep
+# writing. Taking one only copies the top-level map; guild maps are shared copy-on-write, so the
+# first write to a guild while a snapshot still holds it gives the store a private copy of that
+# guild (records included) and the snapshot never sees a later change.
+
+UNKNOWN_BDATE = "Unknown"
+
+
+def default_record():
+    return {"bdate": UNKNOWN_BDATE, "xp": 0}
+
+
+class DataStore:
+    def __init__(self, path=DATA_FILE):
+        self.path = path
+        self.guilds = {}
+        # "dd-mm" -> {(guild_id, user_id)} for every user with a known birthday
+        self.birthday_index = {}
+        # guild_id -> [(month, day, user_id, zodiac)] sorted by date, for listings
+        self.birthday_lists = {}
+        # True when there are writes that have not been saved yet
+        self.dirty = False
+        # False when the data file was missing or unreadable at load: the store may be empty
+        # for the wrong reason, so backups must not treat missing records as deleted
+        self.loaded_cleanly = False
+        # Change feed for incremental backups: (guild_id, user_id) written or deleted since the
+        # last drain_changes()
+        self.changed_keys = set()
+        self.deleted_keys = set()
+        # Copy-on-write bookkeeping: every snapshot() starts a new generation; a guild map created
+        # or copied before the current generation may be shared with a live snapshot
+        self._generation = 0
+        self._guild_generation = {}
+        self._live_snapshots = 0
+
+    #################################################################################################
+    # Loading and saving
+
+    def load(self):
+        """(Re)load the data file and rebuild every derived index."""
+        try:
+            with open(self.path, "r") as f:
+                guilds = json.load(f)
+            self.loaded_cleanly = isinstance(guilds, dict)
+        except FileNotFoundError:
+            guilds = None
+        except json.JSONDecodeError as e:
+            print(f"Error reading {self.path}, starting with no data: {e}")
+            guilds = None
+        if not isinstance(guilds, dict):
+            self.loaded_cleanly = False
+            guilds = {}
+        self._replace_guilds(guilds)
+
+    def restore(self, guilds):
+        """Replace all data (e.g. restored from the database), rebuild the indexes once, save."""
+        self._replace_guilds(guilds)
+        self.save()
+        self.loaded_cleanly = True
+
+    def _replace_guilds(self, guilds):
+        self.guilds = guilds
+        for guild_data in self.guilds.values():
+            for user_data in guild_data.values():
+                if "bdate" not in user_data:
+                    user_data["bdate"] = UNKNOWN_BDATE
+                if not isinstance(user_data.get("xp"), int):
+                    user_data["xp"] = 0
+        self.rebuild_indexes()
+        self.dirty = False
+        self.changed_keys = set()
+        self.deleted_keys = set()
+        # Freshly loaded maps are not shared with any snapshot
+        self._guild_generation = dict.fromkeys(self.guilds, self._generation)
+
+    def rebuild_indexes(self):
+        self.birthday_index = {}
+        self.birthday_lists = {}
+        for guild_id, guild_data in self.guilds.items():
+            entries = []
+            for user_id, user_data in guild_data.items():
+                bdate = user_data["bdate"]
+                if bdate and bdate != UNKNOWN_BDATE:
+                    pairs = self.birthday_index.setdefault(bdate, set())
+                    pairs.add((int(guild_id), int(user_id)))
+                    entries.append(_birthday_entry(user_id, bdate))
+            if entries:
+                entries.sort()
+                self.birthday_lists[int(guild_id)] = entries
+        ranking.rebuild_rank_index(self.guilds)
+
+    def save(self):
+        """Write the whole store to disk atomically."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.guilds, f, indent=4)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def flush(self):
+        """Save only if something changed since the last save. Returns True if it saved."""
+        if not self.dirty:
+            return False
+        self.save()
+        return True
+
+    #################################################################################################
+    # Reads
+
+    def get_guild(self, guild_id):
+        """Return the guild's {user_id: record} map (empty if unknown). Treat it as read-only."""
+        return self.guilds.get(str(guild_id), {})
+
+    def get_user(self, guild_id, user_id):
+        return self.guilds.get(str(guild_id), {}).get(str(user_id))
+
+    def birthdays_on(self, bdate):
+        """Return {(guild_id, user_id)} celebrating on the "dd-mm" date."""
+        return self.birthday_index.get(bdate, set())
+
+    def birthday_count(self, guild_id):
+        return len(self.birthday_lists.get(int(guild_id), ()))
+
+    def birthday_page(self, guild_id, start, count):
+        """Return [(month, day, user_id, zodiac)] for a slice of the guild's sorted birthdays."""
+        return self.birthday_lists.get(int(guild_id), [])[start : start + count]
+
+    def birthdays_between(self, guild_id, start, end):
+        """Return the guild's entries dated from `start` to `end` inclusive, in calendar order.
+
+        `start` and `end` are (month, day); when end is before start the range wraps across
+        New Year. The listing is in day-of-year order, so this is two bisects per slice.
+        """
+        listing = self.birthday_lists.get(int(guild_id), [])
+        lo = bisect_left(listing, start)
+        # (month, day + 1) sorts after every entry on `end`, even for day 31
+        hi = bisect_left(listing, (end[0], end[1] + 1))
+        if start <= end:
+            return listing[lo:hi]
+        return listing[lo:] + listing[:hi]
+
+    #################################################################################################
+    # Writes (callers decide when to save)
+
+    def ensure_user(self, guild_id, user_id):
+        """Return the user's record for writing, creating a default one if needed."""
+        guild_data = self._writable_guild(guild_id)
+        user_data = guild_data.get(str(user_id))
+        if user_data is None:
+            user_data = default_record()
+            guild_data[str(user_id)] = user_data
+            ranking.update_user_xp(guild_id, user_id, 0)
+            self._mark_changed(guild_id, user_id)
+        return user_data
+
+    def ensure_users(self, guild_id, user_ids):
+        """Create default records for every user that has none. Returns how many were created."""
+        guild_data = self._writable_guild(guild_id)
+        created = [user_id for user_id in user_ids if str(user_id) not in guild_data]
+        for user_id in created:
+            guild_data[str(user_id)] = default_record()
+            self._mark_changed(guild_id, user_id)
+        if created:
+            ranking.add_user_entries(guild_id, created)
+        elif not guild_data:
+            del self.guilds[str(guild_id)]
+            self._guild_generation.pop(str(guild_id), None)
+        return len(created)
+
+    def set_birthday(self, guild_id, user_id, bdate):
+        """Set a user's birthday. Returns True if it changed."""
+        user_data = self.ensure_user(guild_id, user_id)
+        old_bdate = user_data["bdate"]
+        if old_bdate == bdate:
+            return False
+
+        self._unindex_birthday(guild_id, user_id, old_bdate)
+        user_data["bdate"] = bdate
+        self._index_birthday(guild_id, user_id, bdate)
+        self._mark_changed(guild_id, user_id)
+        return True
+
+    def set_birthdays(self, guild_id, birthdays):
+        """Set {user_id: bdate} for one guild in one go. Returns how many changed."""
+        return sum(
+            self.set_birthday(guild_id, user_id, bdate)
+            for user_id, bdate in birthdays.items()
+        )
+
+    def add_xp(self, guild_id, user_id, amount):
+        """Add XP to a user. Returns (old_xp, new_xp)."""
+        user_data = self.ensure_user(guild_id, user_id)
+        old_xp = user_data["xp"]
+        user_data["xp"] = old_xp + amount
+        ranking.update_user_xp(guild_id, user_id, user_data["xp"])
+        self._mark_changed(guild_id, user_id)
+        return old_xp, user_data["xp"]
+
+    def delete_user(self, guild_id, user_id):
+        """Delete a user's record. Returns True if it existed."""
+        guild_id, user_id = str(guild_id), str(user_id)
+        if user_id not in self.guilds.get(guild_id, {}):
+            return False
+
+        guild_data = self._writable_guild(guild_id)
+        user_data = guild_data.pop(user_id)
+        self._unindex_birthday(guild_id, user_id, user_data["bdate"])
+        ranking.remove_user_entry(guild_id, user_id)
+        self.dirty = True
+        self.changed_keys.discard((guild_id, user_id))
+        self.deleted_keys.add((guild_id, user_id))
+
+        # If no more users in the guild, remove the guild entry
+        if not guild_data:
+            del self.guilds[guild_id]
+            self._guild_generation.pop(guild_id, None)
+        return True
+
+    #################################################################################################
+    # Snapshots (copy-on-write)
+
+    @contextmanager
+    def snapshot(self):
+        """Yield a point-in-time {guild_id: {user_id: record}} view. Treat it as read-only.
+
+        Safe to read from another thread while the store keeps being written; the view stays
+        valid (and frozen) until the with block ends.
+        """
+        self._generation += 1
+        self._live_snapshots += 1
+        try:
+            yield dict(self.guilds)
+        finally:
+            self._live_snapshots -= 1
+
+    def _writable_guild(self, guild_id):
+        """Return the guild's map for writing, copying it first if a live snapshot shares it."""
+        guild_id = str(guild_id)
+        guild_data = self.guilds.get(guild_id)
+        if guild_data is None:
+            guild_data = self.guilds[guild_id] = {}
+            self._guild_generation[guild_id] = self._generation
+        elif (
+            self._live_snapshots
+            and self._guild_generation.get(guild_id, 0) < self._generation
+        ):
+            guild_data = {
+                user_id: dict(user_data) for user_id, user_data in guild_data.items()
+            }
+            self.guilds[guild_id] = guild_data
+            self._guild_generation[guild_id] = self._generation
+        return guild_data
+
+    #################################################################################################
+    # Change feed
+
+    def _mark_changed(self, guild_id, user_id):
+        key = (str(guild_id), str(user_id))
+        self.dirty = True
+        self.changed_keys.add(key)
+        # Re-created after a delete: the upsert overwrites the old row, no tombstone needed
+        self.deleted_keys.discard(key)
+
+    def drain_changes(self):
+        """Take the change feed and reset it.
+
+        Returns ({(guild_id, user_id): record copy}, {(guild_id, user_id)} deleted). Records are
+        copied now, so later writes go to the next drain instead of racing the backup.
+        """
+        rows = {}
+        for guild_id, user_id in self.changed_keys:
+            user_data = self.guilds.get(guild_id, {}).get(user_id)
+            if user_data is not None:
+                rows[(guild_id, user_id)] = dict(user_data)
+        deleted = self.deleted_keys
+        self.changed_keys = set()
+        self.deleted_keys = set()
+        return rows, deleted
+
+    def requeue_changes(self, rows, deleted):
+        """Put back a drained batch that could not be backed up."""
+        for key in rows:
+            if key not in self.deleted_keys:
+                self.changed_keys.add(key)
+        for key in deleted:
+            if key not in self.changed_keys:
+                self.deleted_keys.add(key)
+
+    #################################################################################################
+    # Birthday index helpers
+
+    def _index_birthday(self, guild_id, user_id, bdate):
+        if bdate and bdate != UNKNOWN_BDATE:
+            entries = self.birthday_index.setdefault(bdate, set())
+            entries.add((int(guild_id), int(user_id)))
+            listing = self.birthday_lists.setdefault(int(guild_id), [])
+            insort(listing, _birthday_entry(user_id, bdate))
+
+    def _unindex_birthday(self, guild_id, user_id, bdate):
+        entries = self.birthday_index.get(bdate)
+        if entries is None:
+            return
+        entries.discard((int(guild_id), int(user_id)))
+        if not entries:
+            del self.birthday_index[bdate]
+
+        listing = self.birthday_lists.get(int(guild_id))
+        if listing:
+            # (month, day, user_id) sorts just before the full entry, so bisect finds it
+            month, day, user_id, _ = _birthday_entry(user_id, bdate)
+            i = bisect_left(listing, (month, day, user_id))
+            if i < len(listing) and listing[i][:3] == (month, day, user_id):
+                del listing[i]
+            if not listing:
+                del self.birthday_lists[int(guild_id)]
+
+
+def _birthday_entry(user_id, bdate):
+    """Listing entry for a "dd-mm" birthday; the zodiac sign is computed once, here."""
+    day, month = map(int, bdate.split("-"))
+    return (month, day, int(user_id), get_zodiac(day, month))
+
+
+_store = None
+
+
+def get_store() -> DataStore:
+    """Return the process-wide store, loading data.json on first use."""
+    global _store
+    if _store is None:
+        _store = DataStore()
+        _store.load()
+    return _store
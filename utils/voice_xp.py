@@ -0,0 +1,136 @@
+import time
+
+from utils.jobs import schedule_every
+from utils.leveling import calculate_level_and_thresholds, check_level_up
+from utils.store import get_store
+from utils.xp_rules import channel_category_id, get_xp_rules
+from utils.xp_windows import record_xp_gain, save_xp_windows
+
+#####################################################################################################
+# Voice XP
+#
+# Instead of polling every member of every voice channel, we only react to voice state changes:
+# an interval opens when a member starts talking-eligible time in a channel and is credited in
+# bulk when it closes. Long sessions are credited at a checkpoint so a restart loses at most one
+# checkpoint worth of XP. Work is O(state changes + open intervals), never O(members x ticks).
+# A state change only credits in memory: data.json is written by the periodic store flush and
+# the XP windows file by the checkpoint, never per join, leave or mute.
+
+VOICE_XP_PER_MINUTE = 2
+VOICE_CHECKPOINT_SECONDS = 600
+
+# (guild_id, user_id) -> [channel_id, interval start timestamp]
+_open_intervals = {}
+
+
+def _is_eligible(state):
+    """A voice state earns XP when it is in a non-AFK channel and not muted or deafened."""
+    channel = state.channel
+    if channel is None:
+        return False
+    if channel.guild.afk_channel and channel.id == channel.guild.afk_channel.id:
+        return False
+    return not (state.self_mute or state.self_deaf or state.mute or state.deaf)
+
+
+async def _credit_intervals(client, intervals, persist=False):
+    """Credit XP for [(guild_id, user_id, channel_id, seconds)].
+
+    With `persist`, the store and the XP windows are saved once afterwards; otherwise the store
+    is only marked dirty for the next flush.
+    """
+    store = get_store()
+    level_checks = []
+
+    for guild_id, user_id, channel_id, seconds in intervals:
+        rules = get_xp_rules(guild_id)
+
+        # Same rules as text XP: guild level flag, channel ignore list and multipliers
+        if not rules.enabled or rules.is_ignored(channel_id):
+            continue
+
+        guild = client.get_guild(guild_id)
+        member = guild.get_member(user_id) if guild else None
+        role_ids = [role.id for role in member.roles] if member else ()
+        category_id = channel_category_id(guild, channel_id)
+        xp_to_add = round(
+            int(seconds // 60)
+            * VOICE_XP_PER_MINUTE
+            * rules.multiplier(channel_id, role_ids, category_id=category_id)
+        )
+        if xp_to_add <= 0:
+            continue
+
+        old_xp, _ = store.add_xp(guild_id, user_id, xp_to_add)
+        oldlevel, _, _ = calculate_level_and_thresholds(old_xp)
+        record_xp_gain(guild_id, user_id, xp_to_add)
+        level_checks.append((user_id, guild_id, oldlevel))
+
+    if not level_checks:
+        return
+
+    if persist:
+        store.save()
+        save_xp_windows()
+
+    for user_id, guild_id, oldlevel in level_checks:
+        await check_level_up(user_id, guild_id, oldlevel, client)
+
+
+async def handle_voice_state_update(member, before, after, client):
+    """Close and/or open the member's voice interval on join, leave, move or (un)mute."""
+    if member.bot:
+        return
+
+    key = (member.guild.id, member.id)
+    now = time.time()
+    eligible_channel_id = after.channel.id if _is_eligible(after) else None
+
+    # Stream, video and suppress toggles keep the interval running: closing it would floor
+    # the time to whole minutes on every toggle
+    interval = _open_intervals.get(key)
+    if interval is not None and interval[0] == eligible_channel_id:
+        return
+
+    # A leave, move or mute toggle closes the current interval and opens a fresh one below
+    if interval is not None:
+        del _open_intervals[key]
+        channel_id, started_at = interval
+        await _credit_intervals(
+            client, [(member.guild.id, member.id, channel_id, now - started_at)]
+        )
+
+    if eligible_channel_id is not None:
+        _open_intervals[key] = [eligible_channel_id, now]
+
+
+def start_voice_tracking(client):
+    """Open intervals for members who were already in voice when the bot started."""
+    now = time.time()
+    for guild in client.guilds:
+        for channel in guild.voice_channels:
+            for member in channel.members:
+                if member.bot or not member.voice or not _is_eligible(member.voice):
+                    continue
+                _open_intervals.setdefault((guild.id, member.id), [channel.id, now])
+
+
+async def checkpoint_voice_xp_periodically(client):
+    """Run the voice XP checkpoint every VOICE_CHECKPOINT_SECONDS from the job scheduler."""
+    schedule_every("voice_xp_checkpoint", VOICE_CHECKPOINT_SECONDS, checkpoint_voice_xp)
+
+
+async def checkpoint_voice_xp(client, payload=None):
+    """Credit whole minutes of every open interval, keeping the remainder open."""
+    now = time.time()
+    credits = []
+    for (guild_id, user_id), interval in list(_open_intervals.items()):
+        channel_id, started_at = interval
+        whole_minutes = int((now - started_at) // 60)
+        if whole_minutes <= 0:
+            continue
+        credits.append((guild_id, user_id, channel_id, whole_minutes * 60))
+        interval[1] = started_at + whole_minutes * 60
+
+    if credits:
+        await _credit_intervals(client, credits, persist=True)
@@ -0,0 +1,156 @@
+import json
+import os
+from datetime import datetime, timezone
+
+from utils.const import SETTINGS_FILE
+
+#####################################################################################################
+# XP rules
+#
+# Admins can set XP multipliers per channel, per role and per hour of the day. Rather than
+# re-reading settings.json and walking the rule lists for every message, each guild's rules are
+# compiled once (when settings change) into sets, dicts and a 24-slot hour table, so the per-tick
+# cost is a few lookups however many rules exist.
+#
+# Guild settings layout:
+#   "ignore_channel": [channel_id, ...]
+#   "xp_multipliers": {
+#       "channels": {"<channel_id>": 1.5},   # a category ID applies to its channels
+#       "roles": {"<role_id>": 2.0},
+#       "hours": {"<start>-<end>": 1.25}   # UTC hours, end exclusive, may wrap midnight
+#   }
+#   "level_roles": {"<level>": role_id}    # role rewarded once a member reaches the level
+
+MAX_MULTIPLIER = 10.0
+
+
+class CompiledXpRules:
+    __slots__ = (
+        "enabled",
+        "ignored_channels",
+        "channel_multipliers",
+        "role_multipliers",
+        "hour_multipliers",
+        "level_roles",
+        "reward_roles",
+    )
+
+    def __init__(self, guild_settings):
+        multipliers = guild_settings.get("xp_multipliers", {})
+
+        self.enabled = guild_settings.get("level", True)
+        self.ignored_channels = frozenset(guild_settings.get("ignore_channel", []))
+        self.channel_multipliers = {
+            int(channel_id): float(value)
+            for channel_id, value in multipliers.get("channels", {}).items()
+        }
+        self.role_multipliers = {
+            int(role_id): float(value)
+            for role_id, value in multipliers.get("roles", {}).items()
+        }
+
+        # Overlapping hour ranges keep the highest multiplier for each hour
+        hour_table = [None] * 24
+        for hour_range, value in multipliers.get("hours", {}).items():
+            for hour in hours_in_range(*parse_hour_range(hour_range)):
+                if hour_table[hour] is None or value > hour_table[hour]:
+                    hour_table[hour] = float(value)
+        self.hour_multipliers = tuple(1.0 if v is None else v for v in hour_table)
+
+        # Sorted (level, role_id) pairs; reward_roles is every role managed by level rewards
+        self.level_roles = tuple(
+            sorted(
+                (int(level), int(role_id))
+                for level, role_id in guild_settings.get("level_roles", {}).items()
+            )
+        )
+        self.reward_roles = frozenset(role_id for _, role_id in self.level_roles)
+
+    def is_ignored(self, channel_id):
+        return channel_id in self.ignored_channels
+
+    def multiplier(self, channel_id, role_ids=(), hour=None, category_id=None):
+        """Combined multiplier: channel (or its category) x best matching role x hour of day."""
+        if hour is None:
+            hour = datetime.now(timezone.utc).hour
+
+        channel_value = self.channel_multipliers.get(channel_id)
+        if channel_value is None:
+            channel_value = self.channel_multipliers.get(category_id, 1.0)
+        value = channel_value * self.hour_multipliers[hour]
+
+        if self.role_multipliers:
+            role_values = [
+                self.role_multipliers[role_id]
+                for role_id in role_ids
+                if role_id in self.role_multipliers
+            ]
+            if role_values:
+                value *= max(role_values)
+
+        return value
+
+    def desired_reward_roles(self, level):
+        """Role IDs a member at `level` should hold (rewards stack)."""
+        return {
+            role_id
+            for reward_level, role_id in self.level_roles
+            if level >= reward_level
+        }
+
+
+def channel_category_id(guild, channel_id):
+    """Category ID of a guild channel (a thread's parent channel counts), or None."""
+    channel = guild.get_channel_or_thread(channel_id) if guild else None
+    parent = getattr(channel, "parent", None)
+    if parent is not None and getattr(parent, "category_id", None) is not None:
+        return parent.category_id
+    return getattr(channel, "category_id", None)
+
+
+def parse_hour_range(hour_range):
+    """Parse a "start-end" key into two ints."""
+    start, end = hour_range.split("-")
+    return int(start), int(end)
+
+
+def hours_in_range(start, end):
+    """Hours covered by [start, end), wrapping past midnight when start >= end."""
+    if start < end:
+        return range(start, end)
+    return [*range(start, 24), *range(0, end)]
+
+
+# guild_id -> CompiledXpRules
+_compiled_rules = {}
+_loaded = False
+
+
+def _load_settings():
+    if not os.path.exists(SETTINGS_FILE):
+        with open(SETTINGS_FILE, "w") as f:
+            json.dump({}, f)
+    with open(SETTINGS_FILE, "r") as f:
+        return json.load(f)
+
+
+def get_xp_rules(guild_id):
+    """Return the compiled rules for a guild, compiling all guilds from settings on first use."""
+    global _loaded
+    if not _loaded:
+        _loaded = True
+        for settings_guild_id, guild_settings in _load_settings().items():
+            _compiled_rules.setdefault(
+                int(settings_guild_id), CompiledXpRules(guild_settings)
+            )
+
+    rules = _compiled_rules.get(int(guild_id))
+    if rules is None:
+        rules = CompiledXpRules({})
+        _compiled_rules[int(guild_id)] = rules
+    return rules
+
+
+def refresh_xp_rules(guild_id, guild_settings):
+    """Recompile a guild's rules. Call this whenever its settings are written."""
+    _compiled_rules[int(guild_id)] = CompiledXpRules(guild_settings)
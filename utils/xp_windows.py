@@ -0,0 +1,190 @@
+import heapq
+import json
+import os
+import time
+from array import array
+
+from utils.const import XP_WINDOWS_FILE
+
+#####################################################################################################
+# Rolling XP windows
+#
+# Every XP gain is added to two small ring buffers per (guild, user): 24 hourly buckets and
+# 30 daily buckets. A ring only remembers the last `size` buckets, so memory stays bounded by
+# the window length no matter how long the bot runs, and "top this week" is answered by summing
+# at most 7 buckets per active user.
+
+HOURLY_BUCKETS = 24
+DAILY_BUCKETS = 30
+
+# period name -> (ring kind, number of buckets to sum)
+PERIODS = {
+    "day": ("hourly", 24),
+    "week": ("daily", 7),
+    "month": ("daily", 30),
+}
+
+PERIOD_LABELS = {
+    "day": "Last 24 hours",
+    "week": "Last 7 days",
+    "month": "Last 30 days",
+}
+
+
+class BucketRing:
+    """Fixed-size ring of XP counters indexed by an absolute bucket number (hour or day)."""
+
+    __slots__ = ("counts", "last_epoch")
+
+    def __init__(self, size, counts=None, last_epoch=0):
+        self.counts = array("I", counts if counts is not None else [0] * size)
+        self.last_epoch = last_epoch
+
+    def _advance(self, epoch):
+        """Move the head of the ring to `epoch`, zeroing the buckets that were skipped."""
+        size = len(self.counts)
+        gap = epoch - self.last_epoch
+        if gap <= 0:
+            return
+        if gap >= size:
+            self.counts = array("I", [0] * size)
+        else:
+            for e in range(self.last_epoch + 1, epoch + 1):
+                self.counts[e % size] = 0
+        self.last_epoch = epoch
+
+    def add(self, epoch, amount):
+        size = len(self.counts)
+        self._advance(epoch)
+        # Gains older than the ring (clock going backwards) are dropped
+        if self.last_epoch - epoch >= size:
+            return
+        self.counts[epoch % size] += amount
+
+    def total(self, epoch, buckets):
+        """Sum the last `buckets` buckets ending at `epoch` (inclusive)."""
+        size = len(self.counts)
+        start = max(epoch - buckets + 1, self.last_epoch - size + 1)
+        end = min(epoch, self.last_epoch)
+        return sum(self.counts[e % size] for e in range(start, end + 1))
+
+    def is_stale(self, epoch):
+        """True once every bucket in the ring has fallen out of the window."""
+        return epoch - self.last_epoch >= len(self.counts)
+
+
+# guild_id -> {"hourly": {user_id: BucketRing}, "daily": {user_id: BucketRing}}
+_guild_windows = {}
+_loaded = False
+
+
+def _epochs(now=None):
+    now = time.time() if now is None else now
+    return {"hourly": int(now // 3600), "daily": int(now // 86400)}
+
+
+def _get_guild_windows(guild_id):
+    _ensure_loaded()
+    windows = _guild_windows.get(int(guild_id))
+    if windows is None:
+        windows = {"hourly": {}, "daily": {}}
+        _guild_windows[int(guild_id)] = windows
+    return windows
+
+
+def record_xp_gain(guild_id, user_id, amount, now=None):
+    """Add an XP gain to the user's hourly and daily buckets."""
+    windows = _get_guild_windows(guild_id)
+    epochs = _epochs(now)
+    user_id = int(user_id)
+
+    for kind, size in (("hourly", HOURLY_BUCKETS), ("daily", DAILY_BUCKETS)):
+        ring = windows[kind].get(user_id)
+        if ring is None:
+            ring = BucketRing(size, last_epoch=epochs[kind])
+            windows[kind][user_id] = ring
+        ring.add(epochs[kind], amount)
+
+
+def top_xp_gains(guild_id, period, limit=10, now=None):
+    """Return [(user_id, xp_gained)] for the top `limit` users of `period` in the guild."""
+    kind, buckets = PERIODS[period]
+    windows = _get_guild_windows(guild_id)
+    epoch = _epochs(now)[kind]
+
+    totals = (
+        (user_id, ring.total(epoch, buckets))
+        for user_id, ring in windows[kind].items()
+        if epoch - ring.last_epoch < buckets
+    )
+    return heapq.nlargest(
+        limit, (entry for entry in totals if entry[1] > 0), key=lambda x: x[1]
+    )
+
+
+def prune_xp_windows(now=None):
+    """Drop rings that no longer hold any bucket inside their window."""
+    _ensure_loaded()
+    epochs = _epochs(now)
+    for guild_id in list(_guild_windows):
+        windows = _guild_windows[guild_id]
+        for kind in ("hourly", "daily"):
+            rings = windows[kind]
+            for user_id in [u for u, r in rings.items() if r.is_stale(epochs[kind])]:
+                del rings[user_id]
+        if not windows["hourly"] and not windows["daily"]:
+            del _guild_windows[guild_id]
+
+
+#####################################################################################################
+# Persistence (so "this week" survives a restart)
+
+
+def _ensure_loaded():
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+
+    try:
+        with open(XP_WINDOWS_FILE, "r") as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        return
+    except json.JSONDecodeError as e:
+        print(f"Error reading XP windows file: {e}")
+        return
+
+    sizes = {"hourly": HOURLY_BUCKETS, "daily": DAILY_BUCKETS}
+    for guild_id, kinds in raw.items():
+        windows = {"hourly": {}, "daily": {}}
+        for kind, users in kinds.items():
+            if kind not in sizes:
+                continue
+            for user_id, (last_epoch, counts) in users.items():
+                if len(counts) != sizes[kind]:
+                    continue
+                windows[kind][int(user_id)] = BucketRing(
+                    sizes[kind], counts, last_epoch
+                )
+        _guild_windows[int(guild_id)] = windows
+
+
+def save_xp_windows():
+    """Prune stale rings and write the remaining buckets to disk."""
+    prune_xp_windows()
+    raw = {
+        str(guild_id): {
+            kind: {
+                str(user_id): [ring.last_epoch, ring.counts.tolist()]
+                for user_id, ring in windows[kind].items()
+            }
+            for kind in ("hourly", "daily")
+        }
+        for guild_id, windows in _guild_windows.items()
+    }
+
+    tmp_file = f"{XP_WINDOWS_FILE}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(raw, f, separators=(",", ":"))
+    os.replace(tmp_file, XP_WINDOWS_FILE)